@@ -0,0 +1,96 @@
+'''
+Measure the Python overhead of a stored procedure call, without a database.
+
+The backend and cursor are stubs that return a fixed row, so the timings
+only include argument binding, query construction and result handling.
+
+    python bench/call_overhead.py [params] [iterations]
+'''
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc.backend.mysql import MySQLFunc
+from dbproc.backend.pgsql import PgSQLProc
+from dbproc.metrics import Metrics
+
+
+class StubCursor(object):
+    name = None
+    rowcount = 1
+    description = [('result',)]
+    row = (1,)
+
+    def execute(self, query, args=None):
+        pass
+
+    def callproc(self, proc, args):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class StubBackend(object):
+    schema = 'public'
+    schemas = ['public']
+    memo = None
+    metrics = None
+    pool = None
+    replicas = None
+    hedging = None
+    slowlog = None
+    prepare = False
+    lock = None
+
+    def acquire_cursor(self):
+        return StubCursor()
+
+    def get_cursor(self, plain=False):
+        return StubCursor()
+
+    def get_timeout(self):
+        return None
+
+    def release_cursor(self, cursor, error=False):
+        cursor.close()
+
+    def timeout_hint(self):
+        return ''
+
+    def timeout_statement(self):
+        return ''
+
+
+def main(params=10, iterations=100000):
+    backend = StubBackend()
+    names = ['arg%d' % x for x in range(params)]
+    pgsql = PgSQLProc(backend, 'bench', params, names, ['integer'] * params,
+                      'int4')
+    mysql = MySQLFunc(backend, 'bench', 'bench')
+    measured = StubBackend()
+    measured.metrics = Metrics()
+    pgsql_metrics = PgSQLProc(measured, 'bench', params, names,
+                              ['integer'] * params, 'int4')
+
+    args = tuple(range(params))
+    kwargs = dict(zip(names, args))
+    cases = [
+        ('pgsql positional', lambda: pgsql(*args)),
+        ('pgsql keyword', lambda: pgsql(**kwargs)),
+        ('pgsql metrics', lambda: pgsql_metrics(*args)),
+        ('mysql function', lambda: mysql(*args)),
+    ]
+    for name, call in cases:
+        best = min(timeit.repeat(call, number=iterations, repeat=3))
+        print '%-20s %8.3f us/call' % (name, best / iterations * 1e6)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
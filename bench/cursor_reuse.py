@@ -0,0 +1,87 @@
+'''
+Measure the latency of calls to a trivial stored function, with a new cursor
+per call and with cursors reused across calls, against a local server.
+
+With ``threads`` greater than one, the calls are also made from a thread
+pool sharing one thread safe wrapper, and the total throughput is reported.
+The function is created in the default schema, and dropped afterwards.
+
+    python bench/cursor_reuse.py pgsql 'dbname=test' [iterations] [threads]
+    python bench/cursor_reuse.py mysql 'db=test user=test' [iterations]
+'''
+
+import os
+import sys
+import threading
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc.snapshot import connect
+from dbproc.wrap import Wrap
+
+FUNCTIONS = dict(
+    mysql='''
+        CREATE FUNCTION dbproc_bench(a INT) RETURNS INT
+        DETERMINISTIC RETURN a
+    ''',
+    pgsql='''
+        CREATE FUNCTION dbproc_bench(a integer) RETURNS integer
+        AS 'SELECT $1' LANGUAGE sql
+    ''',
+)
+
+
+def execute(connection, query):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query)
+    finally:
+        cursor.close()
+    connection.commit()
+
+
+def threaded(wrapped, iterations, threads):
+    def worker():
+        for x in xrange(iterations // threads):
+            wrapped.dbproc_bench(x)
+
+    workers = [threading.Thread(target=worker) for x in xrange(threads)]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.time() - start
+
+
+def main(driver, dsn, iterations=10000, threads=4):
+    connection = connect(driver, dsn)
+    execute(connection, 'DROP FUNCTION IF EXISTS dbproc_bench')
+    execute(connection, FUNCTIONS[driver])
+
+    try:
+        cases = [
+            ('new cursor', Wrap(connection, cache=None, reuse_cursors=False)),
+            ('reused cursor', Wrap(connection, cache=None)),
+            ('reused threadsafe', Wrap(connection, cache=None,
+                                       threadsafe=True)),
+        ]
+        for name, wrapped in cases:
+            call = lambda: wrapped.dbproc_bench(1)
+            best = min(timeit.repeat(call, number=iterations, repeat=3))
+            print '%-20s %8.1f us/call' % (name, best / iterations * 1e6)
+
+        if threads > 1:
+            wrapped = Wrap(connection, cache=None, threadsafe=True)
+            duration = threaded(wrapped, iterations, threads)
+            print '%-20s %8.1f calls/s' % ('%d threads' % threads,
+                                            iterations / duration)
+    finally:
+        execute(connection, 'DROP FUNCTION dbproc_bench')
+        connection.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2], *map(int, sys.argv[3:]))
@@ -0,0 +1,171 @@
+'''
+Measure the latency of calls to a MySQL stored procedure with INOUT and OUT
+parameters, against a local MySQL server.
+
+The procedure is called with ``callproc`` followed by a ``SELECT`` of the
+parameter variables, as dbproc used to, and through dbproc, which sends
+the call as one multi-statement query. The procedure is created in the
+database of the connection, and dropped afterwards.
+
+    python bench/mysql_procedure.py 'db=test user=test' [iterations]
+
+``--simulate`` only illustrates the round-trip counts, it is not a
+measurement: both call paths run on a stub cursor that waits `rtt`
+milliseconds for each round-trip it is assumed to make, two for
+``callproc`` and the ``SELECT`` of the variables, one for dbproc. The
+difference follows from these assumptions, and from the Python overhead
+of each path; use a server to measure the actual latency.
+
+    python bench/mysql_procedure.py --simulate [iterations] [rtt]
+'''
+
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc.backend.mysql import MySQLProc
+from dbproc.rows import get_factory
+from dbproc.snapshot import connect
+from dbproc.wrap import Wrap
+
+PROCEDURE = '''
+CREATE PROCEDURE dbproc_bench(IN a INT, INOUT b INT, OUT c INT)
+BEGIN
+    SET b = a + b;
+    SET c = a * b;
+END
+'''
+
+
+class StubCursor(object):
+    '''
+    Cursor that waits `rtt` seconds per round-trip. The last statement of a
+    query returns the values of the INOUT and OUT parameters.
+    '''
+
+    description = None
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.results = []
+
+    def callproc(self, proc, args):
+        # One query to set the arguments as variables, one for the CALL
+        time.sleep(2 * self.rtt)
+        self.results = [None, None]
+        self.nextset()
+
+    def execute(self, query, args=None):
+        time.sleep(self.rtt)
+        self.results = [None] * query.count(';') + [[('b',), ('c',)]]
+        self.nextset()
+
+    def nextset(self):
+        if not self.results:
+            return None
+        self.description = self.results.pop(0)
+        return 1
+
+    def fetchone(self):
+        return (3, 3)
+
+    def close(self):
+        pass
+
+
+class StubConnection(object):
+    def __init__(self, rtt):
+        self.rtt = rtt
+
+    def cursor(self):
+        return StubCursor(self.rtt)
+
+
+class StubBackend(object):
+    schema = 'test'
+    memo = None
+    metrics = None
+    pool = None
+    replicas = None
+    hedging = None
+    slowlog = None
+    lock = None
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.factory = get_factory('dict')(('b', 'c'))
+
+    def acquire_cursor(self):
+        return StubCursor(self.rtt)
+
+    def get_rows(self, description):
+        return self.factory
+
+    def get_timeout(self):
+        return None
+
+    def release_cursor(self, cursor, error=False):
+        cursor.close()
+
+
+def callproc(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.callproc('dbproc_bench', (1, 2, None))
+        cursor.execute('SELECT @_dbproc_bench_1 AS b, @_dbproc_bench_2 AS c')
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def main(dsn, iterations=10000):
+    connection = connect('mysql', dsn)
+    cursor = connection.cursor()
+    cursor.execute('DROP PROCEDURE IF EXISTS dbproc_bench')
+    cursor.execute(PROCEDURE)
+    cursor.close()
+
+    try:
+        wrapped = Wrap(connection, cache=None)
+        cases = [
+            ('callproc + select', lambda: callproc(connection)),
+            ('dbproc', lambda: wrapped.dbproc_bench(1, 2)),
+        ]
+        for name, call in cases:
+            best = min(timeit.repeat(call, number=iterations, repeat=3))
+            print '%-20s %8.1f us/call' % (name, best / iterations * 1e6)
+    finally:
+        cursor = connection.cursor()
+        cursor.execute('DROP PROCEDURE dbproc_bench')
+        cursor.close()
+        connection.close()
+
+
+def simulate(iterations=1000, rtt=0.5):
+    iterations = int(iterations)
+    backend = StubBackend(rtt / 1000.0)
+    connection = StubConnection(rtt / 1000.0)
+    procedure = MySQLProc(backend, 'dbproc_bench', params=[
+        ('IN', 'a', 'int'),
+        ('INOUT', 'b', 'int'),
+        ('OUT', 'c', 'int'),
+    ])
+    cases = [
+        ('callproc + select', lambda: callproc(connection)),
+        ('dbproc', lambda: procedure(1, 2)),
+    ]
+    print 'round-trip illustration, assuming %.3f ms per round-trip, ' \
+          'not a measurement' % rtt
+    for name, call in cases:
+        best = min(timeit.repeat(call, number=iterations, repeat=3))
+        print '%-20s %8.1f us/call' % (name, best / iterations * 1e6)
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--simulate':
+        simulate(*map(float, sys.argv[2:]))
+    else:
+        main(sys.argv[1], *map(int, sys.argv[2:]))
@@ -0,0 +1,53 @@
+'''
+Measure time and memory used by the row factories for a large result,
+without a database.
+
+A result of `rows` rows with an integer, float and string column is
+generated as the driver would return it, then converted by each factory in
+a separate process. Memory is the growth of the maximum resident set size.
+
+    python bench/row_factory.py [rows]
+'''
+
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc.rows import FACTORIES
+
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(name, count):
+    rows = [(x, x * 0.5, 'row %d' % x) for x in xrange(count)]
+    factory = FACTORIES[name](('id', 'value', 'label'))
+    before = maxrss()
+    start = time.time()
+    result = factory.rows(rows)
+    elapsed = time.time() - start
+    print '%-8s %8.3f s %8.1f MiB' % (
+        name,
+        elapsed,
+        (maxrss() - before) / 1024.0,
+    )
+    return result
+
+
+def main(count=1000000):
+    for name in sorted(FACTORIES):
+        subprocess.check_call([
+            sys.executable, __file__, '--run', name, str(count),
+        ])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(*map(int, sys.argv[1:]))
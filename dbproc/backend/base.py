@@ -1,4 +1,201 @@
+import atexit
+import contextlib
+import heapq
+import importlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dbproc.rows import get_factory
+
 CLASSES = {}
+MISSING = object()
+
+#: Numbers of the prepared statement names, shared by all backends, as
+#: several backends may prepare statements on the same connection.
+STATEMENT_IDS = itertools.count()
+
+#: Modules that implement a backend, by the top level name of the driver
+#: module that defines the connection type. Backend modules are imported
+#: when the first connection of their driver is seen, see :func:`register`.
+MODULES = {
+    '_mysql': 'dbproc.backend.mysql',
+    'MySQLdb': 'dbproc.backend.mysql',
+    'psycopg2': 'dbproc.backend.pgsql',
+}
+
+#: Entry point group for backends of third party packages.
+ENTRY_POINTS = 'dbproc.backends'
+
+#: Backend class for each connection type seen so far.
+TYPES = {}
+
+#: Seconds after the timeout of a call at which it is cancelled by the
+#: client, in case the server did not enforce the timeout.
+CANCEL_GRACE = 1.0
+
+
+class CallTimeout(Exception):
+    '''
+    Raised when a procedure call did not finish within its timeout.
+    '''
+    pass
+
+
+class Watchdog(object):
+    '''
+    Calls functions at a deadline, unless they are unwatched before. Used
+    to cancel calls that exceed their timeout, and to hedge slow calls, see
+    :mod:`dbproc.hedging`. The thread is started on first use.
+
+    Each function is called on a thread of its own, without holding the
+    lock of the watchdog, so a function that blocks, like a cancellation
+    that connects to the server, does not hold up the other deadlines.
+    Once :meth:`unwatch` returns, the function is not running, and will
+    not run.
+    '''
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.entries = []
+        self.counter = itertools.count()
+        self.thread = None
+        self.stopped = False
+
+    def call(self, entry, func, args):
+        try:
+            func(*args)
+        except Exception:
+            pass
+        finally:
+            with self.condition:
+                entry[4] = False
+                self.condition.notify_all()
+
+    def expire(self):
+        '''
+        Wait for the next deadline, and returns the entries that are due,
+        with their functions, or ``None`` when the watchdog is stopped.
+        Called with the lock held.
+        '''
+        while not self.stopped:
+            if not self.entries:
+                self.condition.wait()
+                continue
+
+            now = time.time()
+            wait = self.entries[0][0] - now
+            if wait > 0:
+                self.condition.wait(wait)
+                continue
+
+            due = []
+            while self.entries and self.entries[0][0] <= now:
+                entry = heapq.heappop(self.entries)
+                if entry[2] is not None:
+                    # Unwatching the entry waits until its function ran
+                    entry[4] = True
+                    due.append((entry, entry[2], entry[3]))
+            if due:
+                return due
+        return None
+
+    def run(self):
+        while True:
+            with self.condition:
+                due = self.expire()
+            if due is None:
+                return
+
+            for entry, func, args in due:
+                thread = threading.Thread(target=self.call,
+                                          args=(entry, func, args),
+                                          name='dbproc-watchdog-call')
+                thread.daemon = True
+                thread.start()
+
+    def stop(self):
+        '''
+        Stop the thread of the watchdog, pending functions are not called.
+        '''
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def unwatch(self, entry):
+        '''
+        Do not call the function of `entry`, as returned by :meth:`watch`,
+        or wait for it to return if it is running.
+        '''
+        with self.condition:
+            entry[2] = None
+            while entry[4]:
+                self.condition.wait()
+            # Drop unwatched entries from the top of the heap, the others
+            # are dropped when their deadline passes
+            while self.entries and self.entries[0][2] is None:
+                heapq.heappop(self.entries)
+
+    def watch(self, deadline, func, *args):
+        '''
+        Call `func` with `args` at `deadline`, a :func:`time.time` value.
+
+        :returns: entry to pass to :meth:`unwatch`
+        '''
+        entry = [deadline, next(self.counter), func, args, False]
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                                               name='dbproc-watchdog')
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(self.stop)
+            heapq.heappush(self.entries, entry)
+            if self.entries[0] is entry:
+                self.condition.notify_all()
+        return entry
+
+
+#: Shared :class:`Watchdog` of all backends.
+WATCHDOG = Watchdog()
+
+
+def register(driver, module):
+    '''
+    Register the backend implemented in `module` for connections defined
+    by the `driver` module. The backend module is only imported once a
+    connection of the driver is passed to :meth:`Backend.for_connection`.
+
+    Packages can also register backends through the ``dbproc.backends``
+    entry point group, with the driver module as name and the backend module
+    as value, for example in ``setup.py``::
+
+        entry_points={
+            'dbproc.backends': ['cx_Oracle = dbproc_oracle.backend'],
+        }
+
+    :param driver: top level name of the driver module
+    :param module: name of the backend module
+    '''
+    MODULES[driver] = module
+    TYPES.clear()
+
+
+def register_entry_points():
+    '''
+    Register the backends advertised through the ``dbproc.backends`` entry
+    point group, backends registered with :func:`register` take precedence.
+    '''
+    try:
+        import pkg_resources
+    except ImportError:
+        return
+
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINTS):
+        MODULES.setdefault(entry_point.name, entry_point.module_name)
 
 
 class BackendTracker(type):
@@ -12,15 +209,181 @@ class BackendTracker(type):
 class Backend(object):
     '''
     Base class for supported backends.
+
+    Procedures are looked up in `schema`, which may also be a list of
+    schemas that are searched in order, like the PostgreSQL ``search_path``.
+    Only procedures whose name starts with `prefix` are inspected.
+
+    Backends share procedure signatures through a :class:`MetadataCache`, so
+    a new backend for a server and schema that were inspected before does
+    not need to query the catalog again.
+
+    If `prepare` is enabled, procedure calls are executed as server side
+    prepared statements. Each statement is prepared once per connection on
+    first use, at most `prepare_limit` statements are kept per connection,
+    the least recently used statement is deallocated when the limit is hit.
+
+    Batched calls made with :meth:`dbproc.procedure.Procedure.many` are sent
+    in chunks of `chunk_size` calls, streamed results from
+    :meth:`dbproc.procedure.Procedure.stream` are fetched in chunks of
+    `itersize` rows.
+
+    Result rows are built by the `row_factory`, see :mod:`dbproc.rows`.
+
+    Results of procedures without side effects can be cached in a `memo`,
+    see :meth:`memoize`. Calls are recorded in `metrics`, and slow calls
+    are logged to the `slowlog`, if given.
+
+    A backend can be shared by several threads, each using its own
+    connection through :meth:`bind`. If the backend has a connection `pool`,
+    each call checks out a connection, see :meth:`session`. Threads that
+    share the connection of the backend must pass ``threadsafe=True``, so
+    calls on that connection are serialized by a lock. This is required
+    for MySQLdb connections, which can not be used by several threads at
+    once.
+
+    Calls to read only procedures can be routed to `replicas`, see
+    :mod:`dbproc.replicas`. Slow calls to read only procedures can be
+    duplicated on another connection by the `hedging` policy, see
+    :mod:`dbproc.hedging`.
+
+    Calls that take longer than `timeout` seconds are cancelled, and raise
+    :class:`CallTimeout`. The timeout is sent to the server along with the
+    call, and the call is cancelled by the :data:`WATCHDOG` if it is still
+    running :data:`CANCEL_GRACE` seconds later. Use :meth:`deadline` to
+    change the timeout for some calls. The timeout applies to each chunk of
+    :meth:`dbproc.procedure.Procedure.many`, to each flush of a
+    :class:`dbproc.batch.Batch`, and to reading the whole result of a
+    streamed call or of :meth:`dbproc.procedure.Procedure.results`.
+
+    With `reuse_cursors`, each thread keeps the cursor of its last call and
+    reuses it for the next call on the same connection, instead of creating
+    a new cursor per call. A cursor is discarded when a call on it fails.
+
+    :param connection: instance of DB API 2.0 connection
+    :param schema: name of the schema, or list of names
+    :param prefix: name prefix
+    :param eager: inspect all procedures at construction
+    :param cache: instance of :class:`dbproc.cache.MetadataCache`
+    :param prepare: use server side prepared statements
+    :param prepare_limit: maximum number of prepared statements per connection
+    :param chunk_size: number of batched calls per round-trip
+    :param itersize: number of rows fetched at a time when streaming
+    :param row_factory: name of a row factory, or a
+                        :class:`dbproc.rows.RowFactory` subclass
+    :param pool: instance of :class:`dbproc.pool.Pool`
+    :param memo: instance of :class:`dbproc.cache.ResultCache`
+    :param metrics: instance of :class:`dbproc.metrics.Metrics`
+    :param slowlog: instance of :class:`dbproc.slowlog.SlowLog`
+    :param replicas: instance of :class:`dbproc.replicas.Replicas`
+    :param timeout: call timeout in seconds, ``None`` to wait forever
+    :param hedging: instance of :class:`dbproc.hedging.Hedging`
+    :param reuse_cursors: reuse cursors across calls, per thread
+    :param threadsafe: serialize calls on the connection of the backend
     '''
 
     __metaclass__ = BackendTracker
 
-    def __init__(self, connection, schema=None, prefix=''):
+    #: NumPy dtypes for the column type codes of the cursor description, see
+    #: :mod:`dbproc.columnar`.
+    dtypes = {}
+
+    def __init__(self, connection, schema=None, prefix='', eager=False,
+            cache=None, prepare=False, prepare_limit=64, chunk_size=1000,
+            itersize=2000, row_factory='dict', pool=None, memo=None,
+            metrics=None, slowlog=None, replicas=None, reuse_cursors=True,
+            threadsafe=False, timeout=None, hedging=None):
+        self.local = threading.local()
         self.connection = connection
         self.schema = schema
         self.prefix = prefix
+        self.eager = eager
+        self.cache = cache
+        self.prepare = prepare
+        self.prepare_limit = prepare_limit
+        self.chunk_size = chunk_size
+        self.itersize = itersize
+        self.row_factory = get_factory(row_factory)
+        self.pool = pool
+        self.memo = memo
+        self.metrics = metrics
+        self.slowlog = slowlog
+        self.replicas = replicas
+        self.timeout = timeout
+        self.hedging = hedging
+        self.reuse_cursors = reuse_cursors
+        self.lock = threadsafe and threading.RLock() or None
+        self.shapes = {}
+        self.identity = None
         self.procedure = {}
+        self.missing = set([])
+        self.statements = {}
+
+    def get_connection(self):
+        return getattr(self.local, 'connection', None) or self.default
+
+    def set_connection(self, connection):
+        self.default = connection
+
+    connection = property(get_connection, set_connection, doc='''
+        The connection used by the current thread, as set by :meth:`bind`, or
+        the default connection of the backend.
+    ''')
+
+    def get_schema_name(self):
+        if self.schemas:
+            return self.schemas[0]
+
+    def set_schema_name(self, schema):
+        if not schema:
+            self.schemas = []
+        elif isinstance(schema, basestring):
+            self.schemas = [schema]
+        else:
+            self.schemas = list(schema)
+
+    schema = property(get_schema_name, set_schema_name, doc='''
+        The name of the first schema procedures are looked up in, all
+        schemas are listed in :attr:`schemas`.
+    ''')
+
+    def acquire_cursor(self):
+        '''
+        Returns a cursor for a call on the current connection, that returns
+        rows as tuples. With :attr:`reuse_cursors`, this is the cursor
+        released by the last call of the current thread, if it was made on
+        the same connection. Pass the cursor to :meth:`release_cursor` when
+        the call is done.
+
+        :rtype: DB API 2.0 cursor
+        '''
+        cached = getattr(self.local, 'cursor', None)
+        if cached is not None:
+            # Taken out of the cache while in use, so nested calls get
+            # their own cursor
+            self.local.cursor = None
+            if cached[0] is self.connection:
+                return cached[1]
+            cached[1].close()
+        return self.get_cursor(plain=True)
+
+    @contextlib.contextmanager
+    def bind(self, connection):
+        '''
+        Use `connection` for the calls made by the current thread within the
+        context.
+
+        :param connection: instance of DB API 2.0 connection
+
+        >>> with backend.bind(connection):
+        ...     backend['test'](...)
+        '''
+        previous = getattr(self.local, 'connection', None)
+        self.local.connection = connection
+        try:
+            yield connection
+        finally:
+            self.local.connection = previous
 
     @classmethod
     def can_handle(self, instance):
@@ -35,14 +398,49 @@ class Backend(object):
     @classmethod
     def for_connection(self, instance, *args, **kwargs):
         '''
-        Returns a backend class if the `instance` connection is supported.
+        Returns a backend if the `instance` connection is supported. The
+        backend class is looked up once per connection type, see
+        :meth:`lookup`.
+
+        :param instance: a DB API 2.0 connection instance
+        :rtype: instance of a :class:`Backend` subclass
+        '''
+        try:
+            cls = TYPES[type(instance)]
+        except KeyError:
+            cls = TYPES[type(instance)] = self.lookup(instance)
+        return cls(instance, *args, **kwargs)
+
+    @classmethod
+    def lookup(self, instance):
+        '''
+        Returns the backend class that can handle the `instance` connection.
+        Only the backend modules registered for the driver modules that
+        define the connection type, or its base classes, are imported. If
+        none of these backends can handle the connection, the backends of
+        third party packages are registered, and all backend modules are
+        imported.
 
         :param instance: a DB API 2.0 connection instance
         :rtype: :class:`Backend` subclass
         '''
-        for cls in CLASSES.values():
-            if cls.can_handle(instance):
-                return cls(instance, *args, **kwargs)
+        drivers = [base.__module__.split('.')[0]
+                   for base in type(instance).__mro__]
+        for attempt in ('drivers', 'all'):
+            if attempt == 'all':
+                register_entry_points()
+                drivers = MODULES.keys()
+
+            for driver in drivers:
+                if driver in MODULES:
+                    try:
+                        importlib.import_module(MODULES[driver])
+                    except ImportError:
+                        pass
+
+            for cls in CLASSES.values():
+                if cls.can_handle(instance):
+                    return cls
 
         raise TypeError('Connection type %r not supported' % instance)
 
@@ -53,7 +451,7 @@ class Backend(object):
         :param func: str
         :rtype: bool
         '''
-        return func in self.procedure
+        return self.resolve(func) is not None
 
     def __getitem__(self, func):
         '''
@@ -62,10 +460,560 @@ class Backend(object):
         :param func: str
         :rtype: callable
         '''
+        proc = self.resolve(func)
+        if proc is None:
+            raise KeyError(func)
+        else:
+            return proc
+
+    def cache_key(self, func=None):
+        '''
+        Returns the :class:`MetadataCache` key for the signatures of `func`,
+        or for the full inventory if no `func` is given.
+
+        :param func: str
+        :rtype: tuple
+        '''
+        if self.identity is None:
+            self.identity = self.get_identity()
+        return (self.identity, tuple(self.schemas), self.prefix, func)
+
+    def can_cancel(self):
+        '''
+        Check if :meth:`cancel` can cancel a running statement.
+
+        :rtype: bool
+        '''
+        return False
+
+    def cancel(self, connection):
+        '''
+        Cancel the statement that is running on `connection`, called from
+        another thread when a call exceeds its timeout.
+
+        :param connection: instance of DB API 2.0 connection
+        '''
+        pass
+
+    def create(self, signature):
+        '''
+        Returns a callable object for a procedure signature, as returned by
+        :meth:`signatures`.
+
+        :param signature: dict
+        :rtype: callable
+        '''
+        raise NotImplementedError
+
+    def deallocate(self):
+        '''
+        Forget the prepared statements of the current connection, for example
+        after ``DEALLOCATE`` was issued outside of the backend. Statements
+        are prepared again on next use.
+        '''
+        self.statements.pop(id(self.connection), None)
+
+    @contextlib.contextmanager
+    def deadline(self, timeout):
+        '''
+        Use `timeout` for the calls made by the current thread within the
+        context, instead of the :attr:`timeout` of the backend.
+
+        :param timeout: seconds, ``None`` to wait forever
+
+        >>> with backend.deadline(0.5):
+        ...     backend['test'](...)
+        '''
+        previous = getattr(self.local, 'timeout', MISSING)
+        self.local.timeout = timeout
+        try:
+            yield
+        finally:
+            if previous is MISSING:
+                del self.local.timeout
+            else:
+                self.local.timeout = previous
+
+    def dispatch(self, signatures):
+        '''
+        Returns a callable object for all `signatures` of a procedure name
+        in one schema. Backends that do not support overloading use the last
+        signature.
+
+        :param signatures: list of dict
+        :rtype: callable
+        '''
+        return self.create(signatures[-1])
+
+    @contextlib.contextmanager
+    def enforce(self, timeout):
+        '''
+        Enforce `timeout` on the calls made on the current connection within
+        the context. The calls set the timeout on the server themselves, the
+        :data:`WATCHDOG` cancels them when they are still running
+        :data:`CANCEL_GRACE` seconds after the timeout. Errors caused by the
+        timeout are raised as :class:`CallTimeout`.
+
+        :param timeout: seconds, ``None`` to wait forever
+        '''
+        if timeout is None:
+            yield
+            return
+
+        entry = WATCHDOG.watch(time.time() + timeout + CANCEL_GRACE,
+                               self.cancel, self.connection)
+        try:
+            yield
+        except Exception, e:
+            if self.is_timeout(e):
+                raise CallTimeout('Call did not finish within %s seconds' %
+                                  (timeout,))
+            raise
+        finally:
+            WATCHDOG.unwatch(entry)
+
+    def execute_batch(self, cursor, calls):
+        '''
+        Execute the queued `calls` of a :class:`dbproc.batch.Batch` in
+        order, and resolve their results. By default each call is sent to
+        the server by itself, backends override this to send all calls in
+        fewer round-trips. On error, the calls after the failed call must
+        be left unresolved.
+
+        :param cursor: DB API 2.0 cursor
+        :param calls: list of :class:`dbproc.batch.Deferred`
+        '''
+        for call in calls:
+            call.procedure.execute(cursor, call.query_args)
+            call.set_result(call.procedure.fetch(cursor))
+
+    def execute_prepared(self, cursor, key, statement, query_args):
+        '''
+        Execute `statement` with `query_args` as prepared statement. The
+        statement is prepared if it was not prepared on the connection yet,
+        or if the server no longer knows about it.
+
+        :param cursor: DB API 2.0 cursor
+        :param key: hashable that identifies the `statement`
+        :param statement: query text with backend specific place holders
+        :param query_args: list of bound arguments
+        '''
+        name = self.get_statement(cursor, key, statement)
+        try:
+            self.execute_statement(cursor, name, query_args)
+        except Exception, e:
+            if not self.is_unknown_statement(e):
+                raise
+
+            self.get_statements().pop(key, None)
+            if not self.can_reprepare():
+                raise
+
+            name = self.get_statement(cursor, key, statement)
+            self.execute_statement(cursor, name, query_args)
+
+    def can_reprepare(self):
+        '''
+        Check if a call can be retried after its prepared statement turned
+        out to be unknown to the server.
+
+        :rtype: bool
+        '''
+        raise NotImplementedError
+
+    def deallocate_statement(self, cursor, name):
+        '''
+        Deallocate the prepared statement `name`.
+        '''
+        raise NotImplementedError
+
+    def execute_statement(self, cursor, name, query_args):
+        '''
+        Execute the prepared statement `name` with `query_args`.
+        '''
+        raise NotImplementedError
+
+    def get_session(self):
+        '''
+        Returns a value that identifies the server session of the current
+        connection, which changes when the connection is re-established.
+
+        :rtype: hashable
+        '''
+        raise NotImplementedError
+
+    def is_unknown_statement(self, error):
+        '''
+        Check if `error` was raised because a prepared statement is unknown
+        to the server.
+
+        :rtype: bool
+        '''
+        raise NotImplementedError
+
+    def prepare_statement(self, cursor, name, statement):
+        '''
+        Prepare `statement` as `name`.
+        '''
+        raise NotImplementedError
+
+    def is_timeout(self, error):
+        '''
+        Check if `error` was raised because a statement was cancelled, or
+        exceeded the server side timeout.
+
+        :rtype: bool
+        '''
+        return False
+
+    def fingerprint(self):
+        '''
+        Returns a digest of the catalog entries for the stored procedures
+        in the schema, which changes whenever a procedure is created,
+        altered or dropped. This is cheaper to query than the signatures.
+
+        :rtype: str
+        '''
+        raise NotImplementedError
+
+    def get_autocommit(self, connection):
+        '''
+        Check if `connection` is in autocommit mode.
+
+        :param connection: instance of DB API 2.0 connection
+        :rtype: bool
+        '''
+        return False
+
+    def get_identity(self):
+        '''
+        Returns a value that identifies the database server and user for the
+        current connection, used to key the :class:`MetadataCache`.
+
+        :rtype: hashable
+        '''
+        raise NotImplementedError
+
+    def get_timeout(self):
+        '''
+        Returns the timeout for calls made by the current thread, as set by
+        :meth:`deadline`, or the :attr:`timeout` of the backend.
+
+        :rtype: float or None
+        '''
+        return getattr(self.local, 'timeout', self.timeout)
+
+    def get_rows(self, description):
+        '''
+        Returns the row factory for results with the given cursor
+        `description`, factories are created once per result shape.
+
+        :param description: DB API 2.0 cursor description
+        :rtype: instance of :class:`dbproc.rows.RowFactory`
+        '''
+        names = tuple([column[0] for column in description])
+        try:
+            return self.shapes[names]
+        except KeyError:
+            factory = self.shapes[names] = self.row_factory(names)
+            return factory
+
+    def get_stream_cursor(self):
+        '''
+        Returns a cursor that keeps the result on the server and fetches rows
+        on demand. Rows are returned as tuples.
+        '''
+        raise NotImplementedError
+
+    def get_statement(self, cursor, key, statement):
+        '''
+        Returns the name of the prepared statement for `key`, preparing
+        `statement` if required.
+
+        :param cursor: DB API 2.0 cursor
+        :param key: hashable that identifies the `statement`
+        :param statement: query text with backend specific place holders
+        :rtype: str
+        '''
+        statements = self.get_statements()
+        name = statements.pop(key, None)
+        if name is None:
+            name = 'dbproc_%d' % next(STATEMENT_IDS)
+            self.prepare_statement(cursor, name, statement)
+        statements[key] = name
+
+        while len(statements) > self.prepare_limit:
+            evict = statements.popitem(last=False)[1]
+            self.deallocate_statement(cursor, evict)
+
+        return name
+
+    def get_statements(self):
+        '''
+        Returns the prepared statements of the current connection, in least
+        recently used order. Statements are forgotten if the connection has
+        been re-established since they were prepared.
+
+        :rtype: :class:`collections.OrderedDict`
+        '''
+        session = self.get_session()
+        try:
+            known, statements = self.statements[id(self.connection)]
+        except KeyError:
+            known = None
+
+        if known != session:
+            statements = OrderedDict()
+            self.statements[id(self.connection)] = (session, statements)
+        return statements
+
+    def has_rows(self, cursor):
+        '''
+        Check if the current result of `cursor` has rows, as opposed to the
+        result of a statement that does not return rows.
+
+        :param cursor: DB API 2.0 cursor
+        :rtype: bool
+        '''
+        return cursor.description is not None
+
+    def inspect(self, func=None):
+        '''
+        Make an inventory of available stored procedures. If `func` is given,
+        only the procedure with that name is looked up. Signatures found in
+        the metadata cache are used without querying the catalog.
+
+        :param func: str
+        '''
+        if self.cache is not None:
+            signatures = self.cache.get(self.cache_key())
+            if signatures is None and func is not None:
+                signatures = self.cache.get(self.cache_key(func))
+            if signatures is not None:
+                self.load(signatures)
+                return
+
+        signatures = self.signatures(func)
+        if self.cache is not None and (func is None or signatures):
+            self.cache.set(self.cache_key(func), signatures)
+        self.load(signatures)
+
+    def invalidate(self, func=None):
+        '''
+        Forget the signature of procedure `func`, or of all procedures if no
+        `func` is given, both in this backend and in the metadata cache. The
+        catalog is inspected again on the next access.
+
+        :param func: str
+        '''
+        # The inventory is no longer complete, procedures are looked up on
+        # access from now on
+        self.eager = False
+        if func is None:
+            self.procedure.clear()
+            self.missing.clear()
+        else:
+            self.procedure.pop(func, None)
+            self.missing.discard(func)
+        for cache in (self.cache, self.memo):
+            if cache is None:
+                continue
+            for schema in self.schemas:
+                cache.invalidate(schema, func)
+
+    def like_prefix(self):
+        '''
+        Returns a ``LIKE`` pattern that matches names starting with the
+        prefix.
+
+        :rtype: str
+        '''
+        prefix = self.prefix
+        for char in '\\%_':
+            prefix = prefix.replace(char, '\\' + char)
+        return prefix + '%'
+
+    def load(self, signatures):
+        '''
+        Create callable objects for the given procedure signatures. If a
+        procedure exists in several schemas, the signatures for the first
+        schema in :attr:`schemas` are used.
+
+        :param signatures: list of dict
+        '''
+        rank = dict([
+            (schema, index) for index, schema in enumerate(self.schemas)
+        ])
+        loaded = {}
+        for signature in signatures:
+            name = signature['proc']
+            order = rank.get(signature.get('schema'), len(rank))
+            if name not in loaded or order < loaded[name][0]:
+                loaded[name] = (order, [signature])
+            elif order == loaded[name][0]:
+                loaded[name][1].append(signature)
+
+        for name, (order, overloads) in loaded.iteritems():
+            self.procedure[name] = self.dispatch(overloads)
+
+    def memoize(self, procedure, query_args):
+        '''
+        Call `procedure` with bound `query_args`, or return the result of an
+        earlier call from the memo. Only results of immutable procedures are
+        cached across sessions, results of stable procedures are cached
+        within a :meth:`session` if the memo is configured to do so. Calls
+        with unhashable arguments are never cached.
+
+        :param procedure: instance of :class:`dbproc.procedure.Procedure`
+        :param query_args: list of bound arguments
+        '''
+        if procedure.volatility == 'immutable':
+            results = self.memo
+        else:
+            results = self.memo.get_scope()
+        if results is None:
+            return procedure.run(query_args)
+
+        if self.identity is None:
+            with self.session():
+                self.identity = self.get_identity()
+        # Overloads may take arguments that compare equal, such as 1 and 1.0
+        key = (self.identity, (procedure.schema,), tuple(query_args),
+               procedure.proc, getattr(procedure, 'key', None))
+        try:
+            result = results.get(key, MISSING)
+        except TypeError:
+            return procedure.run(query_args)
+
+        self.memo.record(result is not MISSING)
+        if result is MISSING:
+            result = procedure.run(query_args)
+            results.set(key, result)
+        return result
+
+    @contextlib.contextmanager
+    def memo_scope(self):
+        '''
+        Cache results of stable procedures within the context, if the memo
+        is configured to do so, see :meth:`dbproc.cache.ResultCache.scope`.
+        '''
+        if self.memo is None:
+            yield
+        else:
+            with self.memo.scope():
+                yield
+
+    def next_result(self, cursor):
+        '''
+        Move `cursor` to its next result set.
+
+        :param cursor: DB API 2.0 cursor
+        :rtype: bool, ``False`` if there are no more result sets
+        '''
+        return bool(cursor.nextset())
+
+    def release_cursor(self, cursor, error=False):
+        '''
+        Release a `cursor` returned by :meth:`acquire_cursor`. The cursor is
+        kept for the next call of the current thread with
+        :attr:`reuse_cursors`, unless the call failed, otherwise it is
+        closed.
+
+        :param cursor: DB API 2.0 cursor
+        :param error: ``True`` if the call on the cursor failed
+        '''
+        if self.reuse_cursors and not error and self.reset_cursor(cursor):
+            cached = getattr(self.local, 'cursor', None)
+            if cached is not None:
+                # Released by a nested call
+                cached[1].close()
+            self.local.cursor = (self.connection, cursor)
+        else:
+            cursor.close()
+
+    def reset_cursor(self, cursor):
+        '''
+        Prepare `cursor` for reuse by a next call.
+
+        :param cursor: DB API 2.0 cursor
+        :rtype: bool, ``False`` if the cursor can not be reused
+        '''
+        return True
+
+    def resolve(self, func):
+        '''
+        Returns the callable object for the procedure with the name `func`,
+        or ``None`` if there is no such procedure. Unless the backend was
+        eagerly inspected, procedures are looked up in the catalog the first
+        time they are accessed and remembered afterwards.
+
+        :param func: str
+        :rtype: callable or None
+        '''
+        if func in self.procedure:
+            return self.procedure[func]
+        elif self.eager or func in self.missing:
+            return None
+
+        with self.session():
+            self.inspect(func)
         if func in self.procedure:
             return self.procedure[func]
         else:
-            raise KeyError(func)
+            self.missing.add(func)
+            return None
+
+    @contextlib.contextmanager
+    def session(self):
+        '''
+        Use one connection for all calls made by the current thread within
+        the context. Without a pool, this is the connection of the backend.
+        With a pool, a connection is checked out for the context, unless the
+        thread is already in a session; it is committed when the context
+        exits without error, and rolled back otherwise. Results of stable
+        procedures may be memoized for the duration of the session.
+
+        If the backend is ``threadsafe``, sessions on the connection of the
+        backend hold a lock, so only one thread uses the connection at a
+        time. Calls made in a session are not routed to replicas, so they
+        read the writes made earlier in the session.
+
+        >>> with backend.session():
+        ...     backend['test'](...)
+        '''
+        if getattr(self.local, 'connection', None):
+            with self.memo_scope():
+                yield self.connection
+            return
+        elif self.pool is None:
+            self.local.sessions = getattr(self.local, 'sessions', 0) + 1
+            try:
+                if self.lock is None:
+                    with self.memo_scope():
+                        yield self.connection
+                else:
+                    with self.lock:
+                        with self.memo_scope():
+                            yield self.connection
+            finally:
+                self.local.sessions -= 1
+            return
+
+        with self.pool.connection() as connection:
+            with self.bind(connection):
+                with self.memo_scope():
+                    yield connection
+            connection.commit()
+
+    def signatures(self, func=None):
+        '''
+        Query the catalog for the signatures of the available stored
+        procedures, or only for the procedure `func` if given.
+
+        :param func: str
+        :rtype: list of dict
+        '''
+        raise NotImplementedError
 
 
 class Empty(type):
@@ -73,3 +1021,11 @@ class Empty(type):
     Placeholder class.
     '''
     pass
+
+
+class Default(type):
+    '''
+    Placeholder for an omitted argument that has a default value on the
+    server.
+    '''
+    pass
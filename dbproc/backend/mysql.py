@@ -6,118 +6,280 @@ except ImportError:
 
 import random
 import string
-from dbproc.backend.base import Backend, Empty
+import threading
+from dbproc.backend.base import Backend
 from dbproc.procedure import Procedure
 
 
 class MySQLFunc(Procedure):
     '''
     Callable wrapper for a MySQL stored function.
+
+    Arguments are passed as-is, the names of the parameters in `params` are
+    only kept in :attr:`param_name` for :class:`dbproc.slowlog.SlowLog`.
     '''
 
-    def __init__(self, backend, proc, schema=None, data_type=None):
+    def __init__(self, backend, proc, schema=None, data_type=None,
+            volatility='volatile', read_only=False, params=None):
         self.backend = backend
         self.proc = proc
         self.schema = schema or self.backend.schema
         self.data_type = data_type
+        self.volatility = volatility
+        self.read_only = read_only
+        self.param_name = [name for param_type, name, data_type
+                           in params or ()]
+        self.queries = {}
+
+    def execute(self, cursor, query_args):
+        query, statement = self.get_plan(len(query_args))
+        if self.backend.prepare:
+            # The timeout is part of the statement
+            self.backend.execute_prepared(cursor, (self.proc, query),
+                                          statement, query_args)
+        else:
+            cursor.execute(query, query_args)
+
+    def execute_many(self, cursor, batch):
+        # One SELECT per call, combined with UNION ALL and numbered to
+        # return the results in order. The timeout hint of the first SELECT
+        # applies to the whole statement.
+        query = ' UNION ALL '.join([
+            'SELECT %s%%s AS n, %s.%s(%s) AS result' % (
+                n == 0 and self.backend.timeout_hint() or '',
+                self.schema,
+                self.proc,
+                ', '.join(['%s'] * len(query_args)),
+            )
+            for n, query_args in enumerate(batch)
+        ]) + ' ORDER BY n'
+        params = []
+        for n, query_args in enumerate(batch):
+            params.append(n)
+            params.extend(query_args)
+        cursor.execute(query, params)
+        return [row[1] for row in cursor.fetchall()]
+
+    def call_query(self, query_args):
+        '''
+        Returns the query text and arguments to call the function with
+        bound `query_args`, as sent in a batch.
+
+        :rtype: tuple of (str, list)
+        '''
+        return self.get_plan(len(query_args))[0], query_args
+
+    def collect(self, cursor):
+        '''
+        Returns the result of the call from `cursor`, which is positioned at
+        the first result of the call. When done, the cursor is positioned
+        at the last result of the call.
+        '''
+        return self.fetch(cursor)
+
+    def explain(self, cursor, query_args):
+        query, args = self.call_query(query_args)
+        cursor.execute('EXPLAIN %s' % query, args)
+        return self.fetch_rows(cursor)
+
+    def fetch(self, cursor):
+        return cursor.fetchone()[0]
 
-    def __call__(self, *args, **kwargs):
-        if kwargs:
-            raise TypeError('MySQL function does not support named arguments')
+    def get_plan(self, arity):
+        '''
+        Returns the :meth:`plan` to call the function with `arity` arguments
+        within the timeout of the current thread. Plans without a timeout
+        are cached.
+
+        :param arity: int
+        :rtype: tuple
+        '''
+        hint = self.backend.timeout_hint()
+        if hint:
+            return self.plan(arity, hint)
+
+        plan = self.queries.get(arity)
+        if plan is None:
+            plan = self.queries[arity] = self.plan(arity)
+        return plan
+
+    def plan(self, arity, hint=''):
+        '''
+        Returns the query text, and the prepared statement text, to call the
+        function with `arity` arguments, with the optimizer `hint` as
+        returned by :meth:`MySQLBackend.timeout_hint`.
 
-        query_args = ['%s'] * len(args)
-        query = 'SELECT %(schema)s.%(proc)s(%(args)s) AS result' % dict(
+        :param arity: int
+        :param hint: str
+        :rtype: tuple
+        '''
+        query = 'SELECT %(hint)s%(schema)s.%(proc)s(%(args)s) AS result'
+        return tuple([query % dict(
+            hint=hint,
             schema=self.schema,
-            args=', '.join(query_args),
+            args=', '.join([place_holder] * arity),
             proc=self.proc,
-        )
-        cursor = self.backend.get_cursor()
-        cursor.execute(query, args)
-        try:
-            return cursor.fetchone()['result']
-        finally:
-            cursor.close()
+        ) for place_holder in ('%s', '?')])
 
 
 class MySQLProc(MySQLFunc):
     '''
     Wrapper for a MySQL stored procedure.
+
+    A call is a single round-trip: the values of INOUT parameters are set,
+    the procedure is called and the values of OUT and INOUT parameters are
+    selected in one multi-statement query. This requires the
+    ``CLIENT.MULTI_STATEMENTS`` flag on the connection, which
+    :func:`MySQLdb.connect` sets by default. If the procedure has OUT or
+    INOUT parameters, a call returns their values, otherwise it returns the
+    rows of the first result.
     '''
 
     parameter_characters = string.letters
 
-    def __init__(self, *args, **kwargs):
-        super(MySQLProc, self).__init__(*args, **kwargs)
+    def __init__(self, backend, proc, schema=None, data_type=None,
+            params=None, volatility='volatile', read_only=False):
+        super(MySQLProc, self).__init__(backend, proc, schema, data_type,
+                                        volatility, read_only)
         self.param_type = {}
         self.param_name = []
-        self.inspect()
-
-    def __call__(self, *args, **kwargs):
-        cursor = self.backend.get_cursor()
+        if params is None:
+            self.inspect()
+        else:
+            for param_type, name, data_type in params:
+                self.param_name.append(name)
+                self.param_type[name] = param_type.lower()
+        self.compile()
+
+    def compile(self):
+        self.queries = {}
+        self.outputs = [
+            name for name in self.param_name
+            if self.param_type[name] in ('out', 'inout')
+        ]
+        if not self.param_name:
+            # Signature unknown, arguments are passed as-is
+            return
 
-        fetch = {}
-        if self.param_name:
-            param_seen = set([])
-            query_args = [Empty] * len(self.param_name)
-
-            # Process variadic arguments
-            for i, arg in enumerate(args):
-                query_args[i] = arg
-
-            # Process keyword arguments
-            for name, value in kwargs.iteritems():
-                if name not in self.param_name:
-                    raise TypeError("%s() got an unexpected keyword "
-                                    "argument '%s'" % (self.proc, name))
-
-                index = self.param_name.index(name)
-                if query_args[index] is not Empty:
-                    raise TypeError("%s() got multiple values for keyword "
-                                    "argument '%s'" % (self.proc, name))
-                else:
-                    query_args[index] = value
-
-                param_seen.add(name)
-
-                # INOUT type parameters are a special case, an initial value
-                # has to be provided and the parameter name is passed as a
-                # procedure argument. MySQLdb automatically replaces INOUT and
-                # OUT parameters by @_func_index place holder variables.
-                if self.param_type[name] == 'inout':
-                    fetch['@_%s_%d' % (self.proc, index)] = name
-
-            # Check for left over OUT parameters, we want to catch those
-            for name in param_seen ^ set(self.param_name):
-                index = self.param_name.index(name)
-                if self.param_type[name] == 'out':
-                    query_args[index] = None
-                    fetch['@_%s_%d' % (self.proc, index)] = name
+        super(MySQLProc, self).compile(self.param_name, optional=[
+            name for name in self.param_name
+            if self.param_type[name] == 'out'
+        ])
 
-        else:
-            query_args = list(map(str, args))
-            if kwargs:
-                raise TypeError('MySQL procedure does not support named '
-                                'arguments')
+    def plan(self, arity):
+        '''
+        Returns the query text to call the procedure with `arity` arguments,
+        and the order in which the arguments are passed to the query.
 
-        if Empty in query_args:
-            needs = len(query_args)
-            empty = len([x for x in query_args if x is Empty])
-            raise TypeError("%s() takes exactly %d argument (%d given)" %
-                            (self.proc, needs, needs - empty))
+        OUT and INOUT parameters are passed as user variables, the variables
+        for INOUT parameters are set before the call, and all variables are
+        selected after the call, in the same multi-statement query.
 
-        cursor.callproc(self.proc, query_args)
+        :param arity: int
+        :rtype: tuple of (str, list of int)
+        '''
+        if not self.param_name:
+            return ('CALL %s.%s(%s)' % (
+                self.schema,
+                self.proc,
+                ', '.join(['%s'] * arity),
+            ), range(arity))
+
+        statements = []
+        order = []
+        args = []
+        fetch = []
+        for index, name in enumerate(self.param_name):
+            param_type = self.param_type[name]
+            if param_type == 'in':
+                args.append('%s')
+                continue
+
+            variable = '@_%s_%d' % (self.proc, index)
+            args.append(variable)
+            fetch.append('%s AS `%s`' % (variable, name.replace('`', '``')))
+            if param_type == 'inout':
+                statements.append('SET %s = %%s' % variable)
+                order.append(index)
+
+        order.extend([
+            index for index, name in enumerate(self.param_name)
+            if self.param_type[name] == 'in'
+        ])
+        statements.append('CALL %s.%s(%s)' % (
+            self.schema,
+            self.proc,
+            ', '.join(args),
+        ))
+        if fetch:
+            statements.append('SELECT %s' % ', '.join(fetch))
+        return ('; '.join(statements), order)
+
+    def execute_many(self, cursor, batch):
+        # Procedures can not be called from a SELECT
+        return Procedure.execute_many(self, cursor, batch)
+
+    def explain(self, cursor, query_args):
+        # CALL statements can not be explained
+        return None
+
+    def call_query(self, query_args):
+        arity = len(query_args)
+        plan = self.queries.get(arity)
+        if plan is None:
+            plan = self.queries[arity] = self.plan(arity)
+
+        query, order = plan
+        return query, [query_args[index] for index in order]
+
+    def collect(self, cursor):
+        # The results of the procedure are followed by the result of the
+        # CALL statement itself, which has no rows.
+        self.skip_variables(cursor)
+        rows = None
+        while cursor.description is not None:
+            if rows is None:
+                rows = self.fetch_rows(cursor)
+            cursor.nextset()
+
+        if not self.outputs:
+            return rows or []
+        cursor.nextset()
+        return self.backend.get_rows(cursor.description).row(
+            cursor.fetchone())
+
+    def execute(self, cursor, query_args):
+        # Procedure calls are not prepared. The call is sent as one query,
+        # instead of using callproc, which sets the arguments as variables
+        # in a separate round-trip. The cursor is left on the first result
+        # of the procedure, like callproc does, so it can be streamed.
+        cursor.execute(*self.call_query(query_args))
+        self.skip_variables(cursor)
+
+    def fetch(self, cursor):
+        if not self.outputs:
+            return self.fetch_rows(cursor)
+
+        # The variables are selected by the last statement, skip over the
+        # results of the procedure.
+        while True:
+            if cursor.description is not None:
+                description = cursor.description
+                row = cursor.fetchone()
+            if not cursor.nextset():
+                break
+        return self.backend.get_rows(description).row(row)
+
+    def skip_variables(self, cursor):
+        '''
+        Skip the results of the SET statements for INOUT parameters, which
+        precede the results of the procedure.
 
-        try:
-            if fetch:
-                cursor.execute('SELECT %s' % ', '.join(fetch.keys()))
-                result = cursor.fetchone()
-                for pname, name in fetch.iteritems():
-                    result[name] = result.pop(pname)
-                return result
-            else:
-                return cursor.fetchall()
-        finally:
-            cursor.close()
+        :param cursor: DB API 2.0 cursor
+        '''
+        for name in self.param_name:
+            if self.param_type[name] == 'inout':
+                cursor.nextset()
 
     def inspect(self):
         '''
@@ -161,18 +323,50 @@ class MySQLBackend(Backend):
     Supports the following DB API 2.0 modules:
      * `mysql-python <http://mysql-python.sourceforge.net/>`_
 
+    Call timeouts are sent with the ``MAX_EXECUTION_TIME`` optimizer hint of
+    MySQL 5.7.8 and later, which only applies to ``SELECT`` statements, so
+    to stored functions. Calls that run past their timeout are stopped
+    with ``KILL QUERY`` from a connection of the backend that is kept for
+    this purpose, opened by the ``connect`` function of the connection
+    pool, so this is only available if the backend has a pool.
+
     .. note::
 
        The default ``SHOW FUNCTION STATUS`` and ``SHOW PROCEDURE STATUS``
-       queries do not show signatures, the actual information lives in the
-       ``mysql.proc`` table, but this requires one to set up ``SELECT``
-       privileges.
+       queries do not show signatures. The backend reads them from
+       ``information_schema.parameters`` instead, which is available as of
+       MySQL 5.5. :meth:`MySQLProc.inspect` can still be used to read a
+       signature from the ``mysql.proc`` table, but this requires one to set
+       up ``SELECT`` privileges.
     '''
 
+    # By MySQLdb.constants.FIELD_TYPE. The description does not tell if an
+    # integer column is UNSIGNED, so integers are read as int64, which
+    # holds the unsigned values of all but BIGINT; larger BIGINT UNSIGNED
+    # values are returned as object arrays.
+    dtypes = {
+        0: 'float64',               # DECIMAL
+        1: 'int64',                 # TINY
+        2: 'int64',                 # SHORT
+        3: 'int64',                 # LONG
+        4: 'float32',               # FLOAT
+        5: 'float64',               # DOUBLE
+        7: 'datetime64[us]',        # TIMESTAMP
+        8: 'int64',                 # LONGLONG
+        9: 'int64',                 # INT24
+        10: 'datetime64[D]',        # DATE
+        12: 'datetime64[us]',       # DATETIME
+        13: 'int16',                # YEAR
+        246: 'float64',             # NEWDECIMAL
+    }
+
     def __init__(self, *args, **kwargs):
         super(MySQLBackend, self).__init__(*args, **kwargs)
-        self.schema = self.schema or self.get_schema()
-        self.inspect()
+        self.killer = None
+        self.killer_lock = threading.Lock()
+        self.schemas = self.schemas or [self.get_schema()]
+        if self.eager:
+            self.inspect()
 
     @classmethod
     def can_handle(cls, instance):
@@ -181,13 +375,26 @@ class MySQLBackend(Backend):
         else:
             return isinstance(instance, MySQLdb.connection)
 
-    def get_cursor(self):
+    def get_cursor(self, plain=False):
         '''
-        Returns a cursor for the current database connection.
+        Returns a cursor for the current database connection, that returns
+        rows as dicts, or as tuples if `plain` is set.
 
         :rtype: instance of :class:`MySQLdb.cursor`
         '''
-        return self.connection.cursor(MySQLdb.cursors.DictCursor)
+        if plain:
+            return self.connection.cursor()
+        else:
+            return self.connection.cursor(MySQLdb.cursors.DictCursor)
+
+    def get_stream_cursor(self):
+        '''
+        Returns an unbuffered cursor for the current database connection,
+        rows are read from the server as they are fetched.
+
+        :rtype: instance of :class:`MySQLdb.cursors.SSCursor`
+        '''
+        return self.connection.cursor(MySQLdb.cursors.SSCursor)
 
     def get_schema(self):
         '''
@@ -203,25 +410,245 @@ class MySQLBackend(Backend):
         finally:
             cursor.close()
 
-    def inspect(self):
+    def can_reprepare(self):
+        return True
+
+    def can_cancel(self):
+        return self.pool is not None
+
+    def cancel(self, connection):
+        # The running query can only be killed from another connection. It
+        # is opened with the connect function of the pool, rather than
+        # checked out, as the pool may be exhausted by the calls to cancel.
+        if self.pool is None:
+            return
+        with self.killer_lock:
+            if self.killer is None:
+                self.killer = self.pool.connect()
+            try:
+                cursor = self.killer.cursor()
+                try:
+                    cursor.execute('KILL QUERY %d' % connection.thread_id())
+                finally:
+                    cursor.close()
+            except Exception:
+                # Connect again on the next cancellation
+                killer, self.killer = self.killer, None
+                self.pool.close_connection(killer)
+                raise
+
+    def create(self, signature):
+        if signature['routine_type'] == 'FUNCTION':
+            return MySQLFunc(self,
+                             proc=signature['proc'],
+                             schema=signature['schema'],
+                             data_type=signature['data_type'],
+                             volatility=signature['volatility'],
+                             read_only=signature.get('read_only', False),
+                             params=signature['params'])
+        else:
+            return MySQLProc(self,
+                             proc=signature['proc'],
+                             schema=signature['schema'],
+                             params=signature['params'],
+                             volatility=signature['volatility'],
+                             read_only=signature.get('read_only', False))
+
+    def deallocate_statement(self, cursor, name):
+        cursor.execute('DEALLOCATE PREPARE %s' % name)
+
+    def execute_statement(self, cursor, name, query_args):
+        # MySQL only accepts user variables as prepared statement arguments,
+        # these are set in the same multi-statement query as the EXECUTE.
+        # Errors of the EXECUTE are raised when moving to its result.
+        if query_args:
+            variables = ['@%s_%d' % (name, x) for x in xrange(len(query_args))]
+            cursor.execute('SET %s; EXECUTE %s USING %s' % (
+                ', '.join(['%s = %%s' % variable for variable in variables]),
+                name,
+                ', '.join(variables),
+            ), query_args)
+            cursor.nextset()
+        else:
+            cursor.execute('EXECUTE %s' % name)
+
+    def fingerprint(self):
+        query = '''
+        SELECT CONCAT_WS(':'
+               ,COUNT(*)
+               ,MAX(LAST_ALTERED)
+               ,SUM(CRC32(CONCAT_WS(':'
+                    ,ROUTINE_SCHEMA
+                    ,ROUTINE_NAME
+                    ,LAST_ALTERED
+               )))
+               ) AS fingerprint
+          FROM information_schema.routines
+         WHERE ROUTINE_SCHEMA IN (%s)
+        ''' % ', '.join(['%s'] * len(self.schemas))
+        cursor = self.get_cursor()
+        cursor.execute(query, self.schemas)
+        try:
+            return cursor.fetchone()['fingerprint']
+        finally:
+            cursor.close()
+
+    def execute_batch(self, cursor, calls):
+        # All calls are sent as one multi-statement query, and their results
+        # are read in order. The server stops at the first failing
+        # statement, the error is raised when its result is read.
+        queries = []
+        params = []
+        for call in calls:
+            query, args = call.procedure.call_query(call.query_args)
+            queries.append(query)
+            params.extend(args)
+
+        cursor.execute('; '.join(queries), params)
+        for index, call in enumerate(calls):
+            if index:
+                cursor.nextset()
+            call.set_result(call.procedure.collect(cursor))
+
+        # Read the remaining results, so the connection can be used again
+        while cursor.nextset():
+            pass
+
+    def get_autocommit(self, connection):
+        return connection.get_autocommit()
+
+    def get_identity(self):
+        '''
+        Returns the server host name, port and current user.
+
+        :rtype: tuple
+        '''
+        cursor = self.get_cursor()
+        cursor.execute('SELECT @@hostname AS host, @@port AS port, '
+                       'CURRENT_USER() AS user')
+        try:
+            row = cursor.fetchone()
+            return (row['host'], row['port'], row['user'])
+        finally:
+            cursor.close()
+
+    def get_session(self):
+        return self.connection.thread_id()
+
+    def get_volatility(self, routine):
+        '''
+        Returns the volatility of a `routine` from its ``information_schema``
+        row. MySQL only knows ``DETERMINISTIC``, which is taken to mean
+        immutable for routines that do not read data, and stable for those
+        that do.
+
+        :param routine: dict
+        :rtype: str
+        '''
+        if routine['IS_DETERMINISTIC'] != 'YES' or \
+                routine['SQL_DATA_ACCESS'] == 'MODIFIES SQL DATA':
+            return 'volatile'
+        elif routine['SQL_DATA_ACCESS'] == 'READS SQL DATA':
+            return 'stable'
+        else:
+            return 'immutable'
+
+    def is_timeout(self, error):
+        # ER_QUERY_TIMEOUT, ER_QUERY_INTERRUPTED
+        return isinstance(error, MySQLdb.MySQLError) and \
+            error.args[:1] in ((3024,), (1317,))
+
+    def is_unknown_statement(self, error):
+        # ER_UNKNOWN_STMT_HANDLER
+        return isinstance(error, MySQLdb.MySQLError) and \
+            error.args[:1] == (1243,)
+
+    def prepare_statement(self, cursor, name, statement):
+        cursor.execute('PREPARE %s FROM %%s' % name, (statement,))
+
+    def reset_cursor(self, cursor):
+        # Unread result sets would block the next query on the connection
+        while cursor.nextset():
+            pass
+        return True
+
+    def timeout_hint(self):
+        '''
+        Returns the optimizer hint that limits the execution time of a
+        ``SELECT`` statement to the timeout of the current thread, to
+        insert after ``SELECT``.
+
+        :rtype: str
         '''
-        Make an inventory of available stored functions and procedures by
-        inspecting the ``information_schema.routines`` table.
+        timeout = self.get_timeout()
+        if timeout is None:
+            return ''
+        return '/*+ MAX_EXECUTION_TIME(%d) */ ' % max(1, int(timeout * 1000))
+
+    def signatures(self, func=None):
         '''
-        query = 'SELECT * FROM information_schema.routines'
+        Query the available stored functions and procedures by inspecting
+        the ``information_schema.routines`` table. Procedure signatures are
+        read from ``information_schema.parameters`` in the same query. If
+        `func` is given, only the routine with that name is looked up,
+        otherwise all routines matching the prefix are.
+
+        :param func: str
+        :rtype: list of dict
+        '''
+        query = '''
+        SELECT
+                r.ROUTINE_NAME
+               ,r.ROUTINE_SCHEMA
+               ,r.ROUTINE_TYPE
+               ,r.DATA_TYPE
+               ,r.IS_DETERMINISTIC
+               ,r.SQL_DATA_ACCESS
+               ,p.PARAMETER_MODE
+               ,p.PARAMETER_NAME
+               ,p.DATA_TYPE AS PARAMETER_TYPE
+          FROM information_schema.routines r
+          LEFT JOIN information_schema.parameters p
+            ON p.SPECIFIC_SCHEMA = r.ROUTINE_SCHEMA
+           AND p.SPECIFIC_NAME = r.SPECIFIC_NAME
+           AND p.ORDINAL_POSITION > 0
+         WHERE r.ROUTINE_SCHEMA IN (%s)
+        ''' % ', '.join(['%s'] * len(self.schemas))
+        params = list(self.schemas)
+        if func is not None:
+            query += '   AND r.ROUTINE_NAME = %s'
+            params.append(func)
+        elif self.prefix:
+            query += '   AND r.ROUTINE_NAME LIKE %s'
+            params.append(self.like_prefix())
+        query += ' ORDER BY r.ROUTINE_SCHEMA, r.ROUTINE_NAME, ' \
+                 'p.ORDINAL_POSITION'
+
         cursor = self.get_cursor()
-        cursor.execute(query)
+        cursor.execute(query, params)
+        signatures = []
         for row in cursor.fetchall():
-            proc = row['ROUTINE_NAME']
-            schema = row['ROUTINE_SCHEMA']
-            if row['ROUTINE_TYPE'] == 'FUNCTION':
-                self.procedure[proc] = MySQLFunc(self,
-                                                 proc=proc,
-                                                 schema=schema,
-                                                 data_type=row['DATA_TYPE'])
-            elif row['ROUTINE_TYPE'] == 'PROCEDURE':
-                self.procedure[proc] = MySQLProc(self,
-                                                 proc=proc,
-                                                 schema=schema)
+            if row['ROUTINE_TYPE'] not in ('FUNCTION', 'PROCEDURE'):
+                continue
+            if not signatures or \
+                    signatures[-1]['proc'] != row['ROUTINE_NAME'] or \
+                    signatures[-1]['schema'] != row['ROUTINE_SCHEMA']:
+                signatures.append(dict(
+                    proc=row['ROUTINE_NAME'],
+                    schema=row['ROUTINE_SCHEMA'],
+                    routine_type=row['ROUTINE_TYPE'],
+                    data_type=row['DATA_TYPE'],
+                    params=[],
+                    volatility=self.get_volatility(row),
+                    read_only=row['SQL_DATA_ACCESS'] in ('NO SQL',
+                                                         'READS SQL DATA'),
+                ))
+            if row['PARAMETER_NAME'] is not None:
+                signatures[-1]['params'].append([
+                    row['PARAMETER_MODE'],
+                    row['PARAMETER_NAME'],
+                    row['PARAMETER_TYPE'],
+                ])
 
         cursor.close()
+        return signatures
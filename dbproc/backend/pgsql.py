@@ -1,65 +1,515 @@
 try:
     import psycopg2
     import psycopg2._psycopg
+    import psycopg2.extensions
     import psycopg2.extras
 except ImportError:
     psycopg2 = None
 
-from dbproc.backend.base import Backend, Empty
+import datetime
+import decimal
+import itertools
+import weakref
+from dbproc.backend.base import Backend, Default
+from dbproc.cache import metadata
 from dbproc.procedure import Procedure
 
 
+def quote_name(name):
+    '''
+    Quote an identifier for use in a query.
+
+    :param name: str
+    :rtype: str
+    '''
+    return '"%s"' % name.replace('"', '""')
+
+
+#: Connections whose current transaction has a statement timeout set by
+#: :meth:`PgSQLBackend.timeout_statement`, shared by all backends, as the
+#: timeout applies to the calls of every thread and backend that use the
+#: connection in the transaction.
+LIMITED = weakref.WeakKeyDictionary()
+
+INTEGER_TYPES = ('smallint', 'integer', 'bigint', 'numeric', 'real',
+                 'double precision')
+TEXT_TYPES = ('text', 'character varying', 'character', 'name', '"char"')
+
+#: PostGreSQL type names that accept values of a Python type, used to
+#: select between overloaded procedures.
+TYPE_NAMES = {
+    bool: ('boolean',),
+    int: INTEGER_TYPES,
+    long: INTEGER_TYPES,
+    float: ('real', 'double precision', 'numeric'),
+    decimal.Decimal: ('numeric', 'real', 'double precision'),
+    str: TEXT_TYPES + ('bytea',),
+    unicode: TEXT_TYPES,
+    buffer: ('bytea',),
+    datetime.datetime: ('timestamp without time zone',
+                        'timestamp with time zone'),
+    datetime.date: ('date',),
+    datetime.time: ('time without time zone', 'time with time zone'),
+    datetime.timedelta: ('interval',),
+    dict: ('json', 'jsonb', 'hstore'),
+}
+
+
+def is_polymorphic(type_name):
+    '''
+    Check if `type_name` is a polymorphic pseudo type, such as
+    ``anyelement``.
+
+    :param type_name: str
+    :rtype: bool
+    '''
+    return type_name.startswith('any') or type_name == '"any"'
+
+
+def type_matches(value, type_name):
+    '''
+    Check if `value` can be passed for a parameter of type `type_name`.
+    ``None`` and values of types that are not known are accepted for any
+    type.
+
+    :param value: argument value
+    :param type_name: str
+    :rtype: bool
+    '''
+    if value is None or is_polymorphic(type_name):
+        return True
+    elif isinstance(value, (list, tuple)):
+        return type_name.endswith('[]')
+
+    names = TYPE_NAMES.get(type(value))
+    return names is None or type_name in names
+
+
 class PgSQLProc(Procedure):
     '''
     Callable wrapper for a PostGreSQL stored procedure.
 
+    Calls are schema qualified and cast every argument to its parameter
+    type, so the server does not have to resolve overloads. Arguments for
+    parameters with a default value may be omitted, in which case they are
+    left out of the call.
+
     :param backend: instance of :class:`PgSQLBackend`
     :param proc: name of the stored procedure
-    :param param_count: number of required arguments
+    :param param_count: number of input arguments
     :param param_names: names of the arguments
-    :param param_types: types of the arguments
+    :param param_types: types of the input arguments
+    :param return_type: name of the return type, or ``set``
+    :param schema: name of the schema
+    :param volatility: ``immutable``, ``stable`` or ``volatile``, functions
+                       that are not volatile are :attr:`read_only`
+    :param param_modes: modes of the arguments, ``None`` if all are input
+    :param param_defaults: number of input arguments with a default value
     '''
 
     def __init__(self, backend, proc, param_count, param_names, param_types,
-            return_type):
+            return_type, schema=None, volatility='volatile',
+            param_modes=None, param_defaults=0):
         self.backend = backend
         self.proc = proc
+        self.schema = schema or self.backend.schema
+        self.volatility = volatility
+        self.read_only = volatility != 'volatile'
         self.param_count = param_count
         self.param_name = param_names
         self.param_type = param_types
+        self.param_mode = param_modes
+        self.param_defaults = param_defaults
         self.return_type = return_type
+        self.compile()
 
-    def __call__(self, *args, **kwargs):
-        query_args = list(args) + [Empty] * (self.param_count - len(args))
+    def __repr__(self):
+        return '<%s %s.%s(%s)>' % (
+            self.__class__.__name__,
+            self.schema,
+            self.proc,
+            ', '.join(self.param_type),
+        )
+
+    def compile(self):
+        names = list(self.param_name or [])
+        modes = [mode for mode in self.param_mode or () if mode in 'ibv']
+        if self.param_mode:
+            # Names of all arguments, keep those of the input arguments.
+            names = [
+                name
+                for name, mode in zip(names, self.param_mode)
+                if mode in 'ibv'
+            ]
+        names = [name or None for name in names[:self.param_count]]
+        names.extend([None] * (self.param_count - len(names)))
+        super(PgSQLProc, self).compile(names, defaults=self.param_defaults)
+        self.key = (self.schema, self.proc, tuple(self.param_type))
+        self.variadic = bool(modes) and modes[-1] == 'v'
+        # Batches pass arguments through a VALUES list, which needs concrete
+        # types to cast to.
+        self.batchable = self.return_type != 'set' and not self.variadic and \
+            not any(map(is_polymorphic, self.param_type))
+        self.plans = {}
+        self.query, self.statement = self.plan(())
 
-        for name, value in kwargs.iteritems():
-            if name not in self.param_name:
-                raise TypeError("%s() got an unexpected keyword argument "
-                                "'%s'" % (self.proc, name))
+    def plan(self, omitted):
+        '''
+        Returns the query text, and the prepared statement text, to call the
+        procedure without the arguments for the parameters at the indices in
+        `omitted`. Arguments after the first omitted argument are passed in
+        named notation.
 
-            index = self.param_name.index(name)
-            if query_args[index] is not Empty:
-                raise TypeError("%s() got multiple values for keyword"
-                                "argument '%s'" % (self.proc, name))
+        :param omitted: tuple of int
+        :rtype: tuple
+        '''
+        names = [None] * self.param_count
+        for name, index in self.param_index.iteritems():
+            names[index] = name
+
+        query_args = []
+        statement_args = []
+        for index in xrange(self.param_count):
+            if index in omitted:
+                continue
+            # Polymorphic pseudo types can not be cast to
+            if is_polymorphic(self.param_type[index]):
+                cast = ''
             else:
-                query_args[index] = value
+                cast = '::' + self.param_type[index]
+            for place_holder, args in (('%s', query_args),
+                                       ('$%d' % (len(statement_args) + 1),
+                                        statement_args)):
+                arg = place_holder + cast
+                if omitted and index > omitted[0]:
+                    arg = '%s := %s' % (quote_name(names[index]), arg)
+                if self.variadic and index == self.param_count - 1:
+                    arg = 'VARIADIC ' + arg
+                args.append(arg)
+
+        call = 'SELECT * FROM %s.%s' % (
+            quote_name(self.schema),
+            quote_name(self.proc),
+        )
+        return tuple([
+            '%s(%s)' % (call, ', '.join(args))
+            for args in (query_args, statement_args)
+        ])
+
+    def accepts(self, args, kwargs):
+        '''
+        Check if the types of positional `args` and keyword `kwargs` are
+        compatible with the parameter types, arguments of unknown types are
+        accepted.
+
+        :rtype: bool
+        '''
+        values = list(enumerate(args))
+        values.extend([
+            (self.param_index[name], value)
+            for name, value in kwargs.iteritems()
+        ])
+        for index, value in values:
+            if not type_matches(value, self.param_type[index]):
+                return False
+        return True
+
+    def execute(self, cursor, query_args):
+        if self.param_defaults:
+            query, statement, key, query_args = self.resolve(query_args)
+        else:
+            query, statement, key = self.query, self.statement, self.key
+
+        # Named cursors can not execute a prepared statement, nor set the
+        # timeout in the same query, their calls are only cancelled by the
+        # watchdog
+        if cursor.name is not None:
+            cursor.execute(query, query_args)
+        elif self.backend.prepare:
+            self.backend.execute_prepared(cursor, key, statement, query_args)
+        else:
+            cursor.execute(self.backend.timeout_statement() + query,
+                           query_args)
+
+    def explain(self, cursor, query_args):
+        # ANALYZE runs the call again, which is only safe for functions
+        # without side effects
+        if self.volatility == 'volatile':
+            options = 'FORMAT JSON'
+        else:
+            options = 'ANALYZE, FORMAT JSON'
+        query, statement, key, query_args = self.resolve(query_args)
+        cursor.execute('EXPLAIN (%s) %s' % (options, query), query_args)
+        return cursor.fetchone()[0]
+
+    def resolve(self, query_args):
+        '''
+        Returns the query text, prepared statement text and prepared
+        statement key to call the procedure with bound `query_args`, and the
+        arguments to pass, leaving out omitted arguments.
+
+        :param query_args: list of bound arguments
+        :rtype: tuple
+        '''
+        omitted = tuple([
+            index
+            for index in xrange(self.param_count - self.param_defaults,
+                                self.param_count)
+            if query_args[index] is Default
+        ])
+        if not omitted:
+            return (self.query, self.statement, self.key, query_args)
+
+        plan = self.plans.get(omitted)
+        if plan is None:
+            plan = self.plans[omitted] = self.plan(omitted)
+        return plan + (self.key + (omitted,), [
+            value for value in query_args if value is not Default
+        ])
+
+    def execute_many(self, cursor, batch):
+        query = self.batch_query(cursor, batch)
+        if query is None:
+            return super(PgSQLProc, self).execute_many(cursor, batch)
+
+        cursor.execute(self.backend.timeout_statement() + query)
+        return self.fetch_many(cursor)
+
+    def batch_query(self, cursor, batch):
+        '''
+        Returns the query that calls the function for each list of bound
+        arguments in `batch`, or ``None`` if the calls can not be combined
+        in one query. The results are read with :meth:`fetch_many`.
+
+        :param cursor: DB API 2.0 cursor
+        :param batch: list of lists of bound arguments
+        :rtype: str or None
+        '''
+        if not self.batchable or (self.param_defaults and any([
+                value is Default
+                for query_args in batch
+                for value in query_args[-self.param_defaults:]
+        ])):
+            return None
+
+        # Call the function once per row of a VALUES list, the row number is
+        # used to return the results in order. Arguments are cast to the
+        # parameter types, as the types of VALUES columns are inferred from
+        # the first row. The function is called in the FROM clause, like a
+        # single call, so composite results are expanded into columns.
+        columns = ['a%d' % x for x in xrange(self.param_count)]
+        query = 'SELECT r.* FROM (VALUES %s) AS v(%s), ' \
+                'LATERAL %s.%s(%s) AS r ORDER BY v.n' % (
+            ', '.join([
+                cursor.mogrify(
+                    '(%s)' % ', '.join(['%s'] * (self.param_count + 1)),
+                    [n] + query_args,
+                )
+                for n, query_args in enumerate(batch)
+            ]),
+            ', '.join(['n'] + columns),
+            quote_name(self.schema),
+            quote_name(self.proc),
+            ', '.join([
+                'v.%s::%s' % (column, param_type)
+                for column, param_type in zip(columns, self.param_type)
+            ]),
+        )
+        return query
+
+    def fetch_many(self, cursor):
+        '''
+        Fetch the results of the query of :meth:`batch_query` from
+        `cursor`, in the order of the calls.
+
+        :param cursor: DB API 2.0 cursor
+        :rtype: list
+        '''
+        rows = cursor.fetchall()
+        if len(cursor.description) == 1:
+            return [row[0] for row in rows]
+        factory = self.backend.get_rows(cursor.description)
+        return [factory.row(row) for row in rows]
+
+    def fetch(self, cursor):
+        if self.return_type == 'set':
+            return self.fetch_rows(cursor)
+
+        row = cursor.fetchone()
+        if len(cursor.description) == 1:
+            return row[0]
+        else:
+            return self.backend.get_rows(cursor.description).row(row)
+
+
+class PgSQLOverloads(object):
+    '''
+    Callable wrapper for overloaded PostGreSQL stored procedures, that
+    dispatches calls to the overload that accepts the given arguments.
 
-        if Empty in query_args:
-            needs = self.param_count
-            empty = len([x for x in query_args if x is Empty])
-            raise TypeError("%s() takes exactly %d arguments (%d given)" %
-                            (self.proc, needs, needs - empty))
+    Overloads are selected by the number of positional arguments and the
+    names of the keyword arguments. Only if that leaves several overloads,
+    the types of the arguments are compared with the parameter types, if
+    that does not single out one overload either, :class:`TypeError` is
+    raised.
 
-        cursor = self.backend.get_cursor()
-        cursor.callproc(self.proc, query_args)
-        print self.proc, self.return_type
+    :param backend: instance of :class:`PgSQLBackend`
+    :param overloads: list of :class:`PgSQLProc`
+    '''
+
+    def __init__(self, backend, overloads):
+        self.backend = backend
+        self.overloads = overloads
+        self.proc = overloads[0].proc
+        self.schema = overloads[0].schema
+        # Overloads by number of positional arguments, and by number of
+        # positional arguments and keyword names, filled on first use.
+        self.arity = {}
+        self.keywords = {}
+        for overload in overloads:
+            for given in xrange(overload.param_count - overload.param_defaults,
+                                overload.param_count + 1):
+                self.arity.setdefault(given, []).append(overload)
+
+    def __call__(self, *args, **kwargs):
+        return self.select(args, kwargs)(*args, **kwargs)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.overloads)
+
+    def batches(self, *args, **kwargs):
+        '''
+        Call the procedure and return an iterator over Arrow record batches,
+        see :meth:`dbproc.procedure.Procedure.batches`.
+        '''
+        return self.select(args, kwargs).batches(*args, **kwargs)
+
+    def candidates(self, given, names):
+        '''
+        Returns the overloads that accept `given` positional arguments and
+        keyword arguments `names`.
+
+        :param given: int
+        :param names: frozenset of str
+        :rtype: list
+        '''
+        key = (given, names)
         try:
-            if self.return_type == 'set':
-                return cursor.fetchall()[self.proc]
-            else:
-                return cursor.fetchone()[self.proc]
-        finally:
-            cursor.close()
+            return self.keywords[key]
+        except KeyError:
+            pass
+
+        candidates = []
+        for overload in self.overloads:
+            if given > overload.param_count:
+                continue
+            indices = [overload.param_index.get(name) for name in names]
+            if None in indices or min(indices) < given:
+                continue
+            bound = set(range(given)) | set(indices)
+            if set(overload.param_required) <= bound:
+                candidates.append(overload)
+
+        self.keywords[key] = candidates
+        return candidates
+
+    def columns(self, *args, **kwargs):
+        '''
+        Call the procedure and return the result as a NumPy array per
+        column, see :meth:`dbproc.procedure.Procedure.columns`.
+        '''
+        return self.select(args, kwargs).columns(*args, **kwargs)
+
+    def many(self, iterable, chunk_size=None):
+        '''
+        Call the procedure for each item in `iterable`, consecutive items for
+        the same overload are batched, see
+        :meth:`dbproc.procedure.Procedure.many`.
+
+        :rtype: list
+        '''
+        results = []
+        with self.backend.session():
+            for overload, items in itertools.groupby(iterable,
+                                                     self.select_item):
+                results.extend(overload.many(items, chunk_size))
+        return results
+
+    def results(self, *args, **kwargs):
+        '''
+        Call the procedure and return its result sets, see
+        :meth:`dbproc.procedure.Procedure.results`.
+        '''
+        return self.select(args, kwargs).results(*args, **kwargs)
+
+    def select(self, args, kwargs):
+        '''
+        Returns the overload to call with positional `args` and keyword
+        `kwargs`.
+
+        :rtype: :class:`PgSQLProc`
+        '''
+        if kwargs:
+            candidates = self.candidates(len(args), frozenset(kwargs))
+        else:
+            candidates = self.arity.get(len(args), ())
+
+        if len(candidates) == 1:
+            return candidates[0]
+        elif not candidates:
+            raise TypeError('%s() has no overload that takes %d positional '
+                            'arguments and keyword arguments %s' % (
+                                self.proc, len(args),
+                                ', '.join(sorted(kwargs)) or 'none'))
+
+        matches = [
+            overload for overload in candidates
+            if overload.accepts(args, kwargs)
+        ]
+        if len(matches) == 1:
+            return matches[0]
+        else:
+            raise TypeError('%s() call is ambiguous, candidates are %s' % (
+                self.proc,
+                ', '.join([
+                    '(%s)' % ', '.join(overload.param_type)
+                    for overload in matches or candidates
+                ]),
+            ))
+
+    def select_item(self, item):
+        '''
+        Returns the overload for an item passed to :meth:`many`.
+        '''
+        if isinstance(item, dict):
+            return self.select((), item)
+        else:
+            return self.select(tuple(item), {})
+
+    def stream(self, *args, **kwargs):
+        '''
+        Call the procedure and return an iterator over the resulting rows,
+        see :meth:`dbproc.procedure.Procedure.stream`.
+        '''
+        return self.select(args, kwargs).stream(*args, **kwargs)
+
+    def stream_results(self, *args, **kwargs):
+        '''
+        Call the procedure and return its result sets, reading rows from the
+        server as they are fetched, see
+        :meth:`dbproc.procedure.Procedure.stream_results`.
+        '''
+        return self.select(args, kwargs).stream_results(*args, **kwargs)
+
+    def with_timeout(self, timeout):
+        '''
+        Returns a callable that calls the procedure with `timeout`, see
+        :meth:`dbproc.procedure.Procedure.with_timeout`.
+        '''
+        def call(*args, **kwargs):
+            with self.backend.deadline(timeout):
+                return self(*args, **kwargs)
+        return call
 
 
 class PgSQLBackend(Backend):
@@ -70,10 +520,27 @@ class PgSQLBackend(Backend):
       * `psycopg2 <http://initd.org/psycopg/>`_
     '''
 
+    # By type OID, timestamps with time zone are kept as datetime objects
+    dtypes = {
+        16: 'bool',                 # boolean
+        20: 'int64',                # bigint
+        21: 'int16',                # smallint
+        23: 'int32',                # integer
+        26: 'uint32',               # oid
+        700: 'float32',             # real
+        701: 'float64',             # double precision
+        1700: 'float64',            # numeric
+        1082: 'datetime64[D]',      # date
+        1114: 'datetime64[us]',     # timestamp without time zone
+        1186: 'timedelta64[us]',    # interval
+    }
+
     def __init__(self, *args, **kwargs):
         super(PgSQLBackend, self).__init__(*args, **kwargs)
-        self.schema = self.schema or self.get_schema()
-        self.inspect()
+        self.cursor_id = itertools.count()
+        self.schemas = self.schemas or self.get_search_path()
+        if self.eager:
+            self.inspect()
 
     @classmethod
     def can_handle(cls, instance):
@@ -82,16 +549,46 @@ class PgSQLBackend(Backend):
         else:
             return isinstance(instance, psycopg2._psycopg.connection)
 
-    def get_cursor(self):
+    def get_cursor(self, plain=False):
+        '''
+        Returns a cursor for the current database connection, that returns
+        rows as dicts, or as tuples if `plain` is set.
+
+        :rtype: instance of :py:class:`<psycopg2.extensions.cursor>`
+        '''
+        if plain:
+            return self.connection.cursor()
+        else:
+            return self.connection.cursor(
+                cursor_factory=psycopg2.extras.RealDictCursor,
+            )
+
+    def get_stream_cursor(self):
         '''
-        Returns a cursor for the current database connection.
+        Returns a named (server side) cursor for the current database
+        connection. In autocommit mode the cursor is declared ``WITH HOLD``,
+        as there is no transaction to hold it.
 
         :rtype: instance of :py:class:`<psycopg2.extensions.cursor>`
         '''
         return self.connection.cursor(
-            cursor_factory=psycopg2.extras.RealDictCursor,
+            'dbproc_stream_%d' % next(self.cursor_id),
+            withhold=self.connection.autocommit,
         )
 
+    def get_search_path(self):
+        '''
+        Get the schemas in the search path that exist, in search order.
+
+        :rtype: list of str
+        '''
+        cursor = self.get_cursor()
+        cursor.execute('SELECT current_schemas(false) AS schemas')
+        try:
+            return cursor.fetchone()['schemas']
+        finally:
+            cursor.close()
+
     def get_schema(self):
         '''
         Get the currently active schema.
@@ -105,32 +602,307 @@ class PgSQLBackend(Backend):
         finally:
             cursor.close()
 
-    def inspect(self):
+    def can_reprepare(self):
+        # In a transaction the error has aborted the transaction
+        return self.connection.autocommit
+
+    def can_cancel(self):
+        return True
+
+    def cancel(self, connection):
+        connection.cancel()
+
+    def create(self, signature):
+        return PgSQLProc(self, **signature)
+
+    def dispatch(self, signatures):
+        if len(signatures) == 1:
+            return self.create(signatures[0])
+        else:
+            return PgSQLOverloads(self, map(self.create, signatures))
+
+    def deallocate_statement(self, cursor, name):
+        cursor.execute('DEALLOCATE %s' % name)
+
+    def execute_batch(self, cursor, calls):
+        # Consecutive calls to the same function are sent together, in
+        # chunks, through the VALUES list of PgSQLProc.batch_query. If a
+        # chunk fails, its calls are executed again one by one, so the
+        # error is raised for the call that failed. In a transaction, the
+        # chunk is rolled back to a savepoint first, which is set in the
+        # same query as the chunk.
+        transaction = not self.connection.autocommit or \
+            self.connection.get_transaction_status() != \
+            psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        savepoint = None
+        for procedure, group in itertools.groupby(
+                calls, lambda call: call.procedure):
+            group = list(group)
+            for start in xrange(0, len(group), self.chunk_size):
+                chunk = group[start:start + self.chunk_size]
+                query = len(chunk) > 1 and procedure.batch_query(cursor, [
+                    call.query_args for call in chunk
+                ])
+                if not query:
+                    super(PgSQLBackend, self).execute_batch(cursor, chunk)
+                    continue
+
+                if not transaction:
+                    # The failed query was rolled back by itself
+                    savepoint = ''
+                elif savepoint is None:
+                    savepoint = 'SAVEPOINT dbproc_batch; '
+                else:
+                    savepoint = 'RELEASE SAVEPOINT dbproc_batch; ' \
+                                'SAVEPOINT dbproc_batch; '
+                try:
+                    cursor.execute(self.timeout_statement() + savepoint +
+                                   query)
+                    results = procedure.fetch_many(cursor)
+                except Exception, e:
+                    if self.is_timeout(e):
+                        raise
+                    if savepoint:
+                        cursor.execute('ROLLBACK TO SAVEPOINT dbproc_batch')
+                    super(PgSQLBackend, self).execute_batch(cursor, chunk)
+                    continue
+
+                for call, result in zip(chunk, results):
+                    call.set_result(result)
+
+    def execute_statement(self, cursor, name, query_args):
+        if query_args:
+            cursor.execute('%sEXECUTE %s (%s)' % (
+                self.timeout_statement(),
+                name,
+                ', '.join(['%s'] * len(query_args)),
+            ), query_args)
+        else:
+            cursor.execute('%sEXECUTE %s' % (self.timeout_statement(), name))
+
+    def fingerprint(self):
+        query = '''
+        SELECT md5(string_agg(p.oid::text || ':' || p.xmin::text, ','
+                              ORDER BY p.oid)) AS fingerprint
+          FROM pg_catalog.pg_proc p
+          JOIN pg_catalog.pg_namespace n
+            ON n.oid = p.pronamespace
+         WHERE n.nspname = ANY(%s)
         '''
-        Make an inventory of available stored procedures by inspecting the
-        ``pg_catalog.pg_prog`` table.
+        cursor = self.get_cursor()
+        cursor.execute(query, (self.schemas,))
+        try:
+            return cursor.fetchone()['fingerprint']
+        finally:
+            cursor.close()
+
+    def get_autocommit(self, connection):
+        return connection.autocommit
+
+    def get_identity(self):
+        '''
+        Returns the connection DSN, which identifies the server, database and
+        user.
+
+        :rtype: str
+        '''
+        return self.connection.dsn
+
+    def get_session(self):
+        return self.connection.get_backend_pid()
+
+    def is_timeout(self, error):
+        # query_canceled
+        return getattr(error, 'pgcode', None) == '57014'
+
+    def is_unknown_statement(self, error):
+        # invalid_sql_statement_name
+        return getattr(error, 'pgcode', None) == '26000'
+
+    def has_rows(self, cursor):
+        # Named cursors only have a description after a fetch
+        return cursor.name is not None or cursor.description is not None
+
+    def next_result(self, cursor):
+        # Functions return a single result, psycopg2 does not implement
+        # nextset()
+        return False
+
+    def prepare_statement(self, cursor, name, statement):
+        cursor.execute('PREPARE %s AS %s' % (name, statement))
+
+    def timeout_statement(self):
+        '''
+        Returns the statement that sets the timeout of the current thread on
+        the server, to send in front of a call in the same query. The
+        statements of a query run in one transaction, so ``SET LOCAL`` also
+        applies in autocommit mode, and needs no round-trip to undo. Servers
+        before PostgreSQL 13 start the timer of a query before the timeout
+        is set, their calls are only cancelled by the watchdog.
+
+        :rtype: str
+        '''
+        timeout = self.get_timeout()
+        connection = self.connection
+        if timeout is not None:
+            if not connection.autocommit:
+                LIMITED[connection] = True
+            return 'SET LOCAL statement_timeout = %d; ' % (
+                max(1, timeout * 1000),
+            )
+        elif LIMITED and LIMITED.pop(connection, None):
+            # An earlier call in the transaction of this connection set a
+            # timeout, that lasts until the end of the transaction
+            return 'SET LOCAL statement_timeout = DEFAULT; '
+        return ''
+
+    def signatures(self, func=None):
+        '''
+        Query the available stored procedures by inspecting the
+        ``pg_catalog.pg_prog`` table. If `func` is given, only the procedure
+        with that name is looked up, otherwise all procedures matching the
+        prefix are. Overloaded procedures have a signature per overload.
+
+        :param func: str
+        :rtype: list of dict
         '''
         query = '''
         SELECT
                 p.proname AS proc
+               ,n.nspname AS schema
                ,p.pronargs AS param_count
                ,p.proargnames AS param_names
-               ,string_to_array(
-                array_to_string(p.proargtypes::regtype[], ' '), ' '
-               ) AS param_types
-               ,t.typname AS return_type
+               ,p.proargtypes::regtype[]::text[] AS param_types
+               ,CASE WHEN p.proretset THEN 'set'
+                     ELSE t.typname
+                 END AS return_type
+               ,CASE p.provolatile
+                     WHEN 'i' THEN 'immutable'
+                     WHEN 's' THEN 'stable'
+                     ELSE 'volatile'
+                 END AS volatility
+               ,p.proargmodes AS param_modes
+               ,p.pronargdefaults AS param_defaults
           FROM pg_catalog.pg_proc p
           JOIN pg_catalog.pg_namespace n
             ON n.oid = p.pronamespace
           JOIN pg_catalog.pg_type t
             ON t.oid = p.prorettype
-         WHERE n.nspname = %s;
+         WHERE n.nspname = ANY(%s)
         '''
+        params = [self.schemas]
+        if func is not None:
+            query += '   AND p.proname = %s'
+            params.append(func)
+        elif self.prefix:
+            query += '   AND p.proname LIKE %s'
+            params.append(self.like_prefix())
+
         cursor = self.get_cursor()
-        cursor.execute(query, (self.schema,))
-        for row in cursor.fetchall():
-            proc = row['proc']
-            print self.procedure
-            self.procedure[proc] = PgSQLProc(self, **row)
+        cursor.execute(query, params)
+        try:
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
 
-        cursor.close()
+
+class PgSQLListener(object):
+    '''
+    Invalidates cached procedure signatures when the database notifies that
+    a function was created, altered or dropped. The `connection` should be
+    dedicated to the listener, as it is switched to autocommit mode.
+
+    The notifications can be sent by event triggers, for example::
+
+        CREATE FUNCTION dbproc_notify() RETURNS event_trigger AS $$
+        DECLARE
+            r RECORD;
+        BEGIN
+            FOR r IN SELECT object_identity
+                       FROM pg_event_trigger_ddl_commands()
+                      WHERE object_type = 'function' LOOP
+                PERFORM pg_notify('dbproc', r.object_identity);
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE EVENT TRIGGER dbproc_notify ON ddl_command_end
+            EXECUTE PROCEDURE dbproc_notify();
+
+    Dropped functions can be reported likewise with a ``sql_drop`` event
+    trigger using ``pg_event_trigger_dropped_objects()``.
+
+    Backends keep the callables of the procedures they looked up, attach
+    them to the listener so these are dropped as well, and the changed
+    functions are looked up again on their next call. Attached backends are
+    not kept alive by the listener.
+
+    :param connection: instance of DB API 2.0 connection
+    :param channel: name of the notification channel
+    :param cache: instance of :class:`dbproc.cache.MetadataCache`
+    :param memo: instance of :class:`dbproc.cache.ResultCache`, memoized
+                 results of changed functions are dropped as well
+    :param backends: list of :class:`dbproc.backend.base.Backend`
+
+    >>> listener = PgSQLListener(psycopg2.connect('dbname=test'),
+    ...                          backends=[wrapped.backend])
+    >>> while select.select([listener], [], [])[0]:
+    ...     listener.poll()
+    '''
+
+    def __init__(self, connection, channel='dbproc', cache=None, memo=None,
+            backends=()):
+        self.connection = connection
+        self.channel = channel
+        self.cache = cache or metadata
+        self.memo = memo
+        self.backends = weakref.WeakSet(backends)
+        self.connection.autocommit = True
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('LISTEN "%s"' % self.channel.replace('"', '""'))
+        finally:
+            cursor.close()
+
+    def attach(self, backend):
+        '''
+        Drop the callables of changed functions from `backend` as well.
+
+        :param backend: instance of :class:`dbproc.backend.base.Backend`
+        '''
+        self.backends.add(backend)
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def poll(self):
+        '''
+        Process pending notifications. The payload of each notification is
+        the (optionally schema qualified) name of a function, any argument
+        list is ignored. Returns the number of processed notifications.
+
+        :rtype: int
+        '''
+        self.connection.poll()
+        count = 0
+        while self.connection.notifies:
+            notify = self.connection.notifies.pop(0)
+            name = notify.payload.split('(', 1)[0].replace('"', '')
+            if '.' in name:
+                schema, func = name.rsplit('.', 1)
+            else:
+                schema = func = None
+            for cache in (self.cache, self.memo):
+                if cache is None:
+                    continue
+                elif schema is not None:
+                    cache.invalidate(schema, func or None)
+                else:
+                    cache.invalidate()
+            for backend in list(self.backends):
+                if schema is None or not func:
+                    backend.invalidate()
+                elif schema in backend.schemas:
+                    backend.invalidate(func)
+            count += 1
+        return count
@@ -0,0 +1,209 @@
+'''
+Deferred procedure calls, sent to the server together in one transaction.
+
+Calls made on a :class:`Batch` are bound right away, but only queued, and
+return a :class:`Deferred` result. When the context exits, all queued calls
+are executed in order, in a single transaction, and the deferred results
+are resolved:
+
+>>> with wrapped.batch() as batch:
+...     order = batch.create_order(customer)
+...     batch.add_line(42, 'widget', 3)
+>>> order.result()
+1001
+
+On MySQL, the queued calls are sent to the server as one multi-statement
+query. On PostgreSQL, consecutive calls to the same function are sent in
+one query, like :meth:`dbproc.procedure.Procedure.many` does, other calls
+are a round-trip each, but there is no commit per call. If a call fails,
+its deferred result raises the error, the calls after it are not executed,
+the transaction is rolled back and the error is raised from the context.
+
+The memo, metrics, slow log and replicas of the backend are not used for
+batched calls.
+'''
+
+
+class BatchError(Exception):
+    '''
+    Raised by the result of a call that was not executed.
+    '''
+    pass
+
+
+class Deferred(object):
+    '''
+    Result of a queued call to `procedure` with bound `query_args`, which
+    is available after the batch was executed.
+    '''
+
+    def __init__(self, procedure, query_args):
+        self.procedure = procedure
+        self.query_args = query_args
+        self.finished = False
+        self.value = None
+        self.error = None
+
+    def __repr__(self):
+        if not self.finished:
+            state = 'pending'
+        elif self.error is not None:
+            state = 'failed'
+        else:
+            state = 'done'
+        return '<%s %s.%s %s>' % (self.__class__.__name__,
+                                  self.procedure.schema, self.procedure.proc,
+                                  state)
+
+    def done(self):
+        '''
+        Check if the call was executed, or failed.
+
+        :rtype: bool
+        '''
+        return self.finished
+
+    def exception(self):
+        '''
+        Returns the error of the call, or ``None`` if it succeeded.
+        '''
+        if not self.finished:
+            raise BatchError('The batch was not executed yet')
+        return self.error
+
+    def result(self):
+        '''
+        Returns the result of the call, or raises its error.
+        '''
+        if not self.finished:
+            raise BatchError('The batch was not executed yet')
+        elif self.error is not None:
+            raise self.error
+        return self.value
+
+    def set_exception(self, error):
+        self.finished = True
+        self.error = error
+
+    def set_result(self, value):
+        self.finished = True
+        self.value = value
+
+
+class Batch(object):
+    '''
+    Unit of work that queues procedure calls for `backend`, see
+    :meth:`dbproc.wrap.Wrap.batch`. Procedures are looked up by name with
+    the `prefix`, like :class:`dbproc.wrap.Wrap` does.
+
+    The calls are executed when the context exits without error, or when
+    :meth:`flush` is called. If the batch is made in a session of the
+    backend, it uses the transaction of the session, otherwise it commits
+    when all calls succeeded.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param prefix: name prefix
+    '''
+
+    def __init__(self, backend, prefix=''):
+        self.backend = backend
+        self.prefix = prefix
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
+        try:
+            procedure = self.backend[''.join([self.prefix, attr])]
+        except KeyError:
+            raise AttributeError('No stored function/procedure called %s' %
+                                 attr)
+        return lambda *args, **kwargs: self.queue(procedure, args, kwargs)
+
+    def discard(self):
+        '''
+        Drop the queued calls, their results raise :class:`BatchError`.
+        '''
+        calls, self.calls = self.calls, []
+        for call in calls:
+            call.set_exception(BatchError('The batch was discarded'))
+
+    def flush(self):
+        '''
+        Execute the queued calls in one transaction, and resolve their
+        results.
+        '''
+        calls, self.calls = self.calls, []
+        if not calls:
+            return
+
+        backend = self.backend
+        for call in calls:
+            call.procedure.record_write()
+        owned = not getattr(backend.local, 'connection', None) and \
+            not getattr(backend.local, 'sessions', 0)
+        with backend.session() as connection:
+            cursor = backend.get_cursor(plain=True)
+            try:
+                with backend.enforce(backend.get_timeout()):
+                    self.execute(connection, cursor, calls, owned)
+            finally:
+                cursor.close()
+
+    def execute(self, connection, cursor, calls, owned):
+        '''
+        Execute `calls` on `cursor`, and commit if the batch owns the
+        transaction. Connections in autocommit mode get an explicit
+        transaction.
+        '''
+        explicit = owned and self.backend.get_autocommit(connection)
+        if explicit:
+            cursor.execute('BEGIN')
+
+        try:
+            self.backend.execute_batch(cursor, calls)
+        except Exception, e:
+            # Calls are executed in order, the first unresolved call failed
+            pending = [call for call in calls if not call.done()]
+            pending[0].set_exception(e)
+            for call in pending[1:]:
+                call.set_exception(BatchError('Not executed, an earlier call '
+                                              'in the batch failed'))
+            try:
+                if explicit:
+                    cursor.execute('ROLLBACK')
+                elif owned and self.backend.pool is None:
+                    connection.rollback()
+            except Exception:
+                pass
+            raise
+
+        if explicit:
+            cursor.execute('COMMIT')
+        elif owned and self.backend.pool is None:
+            connection.commit()
+
+    def queue(self, procedure, args, kwargs):
+        '''
+        Bind the arguments for a call to `procedure`, and queue the call.
+
+        :rtype: :class:`Deferred`
+        '''
+        select = getattr(procedure, 'select', None)
+        if select is not None:
+            # Overloaded procedure
+            procedure = select(args, kwargs)
+
+        call = Deferred(procedure, procedure.bind(args, kwargs))
+        self.calls.append(call)
+        return call
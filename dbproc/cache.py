@@ -0,0 +1,184 @@
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class MetadataCache(object):
+    '''
+    Process wide cache for stored procedure signatures, shared by all
+    backends regardless of their connection. Entries are keyed by server
+    identity, schemas, prefix and procedure name, evicted in least recently
+    used order once the cache holds more than `size` entries and expire
+    `ttl` seconds after they were stored.
+
+    :param size: maximum number of entries
+    :param ttl: entry lifetime in seconds, ``None`` to never expire
+
+    >>> cache = MetadataCache(size=256, ttl=60)
+    >>> wrapped = Wrap(connection, cache=cache)
+    >>> cache.invalidate('public', 'test_add')
+    '''
+
+    def __init__(self, size=1024, ttl=300):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        '''
+        Returns the entry stored for `key`, or `default` if there is no such
+        entry or it has expired.
+
+        :param key: tuple of (identity, schemas, prefix, name)
+        '''
+        with self.lock:
+            try:
+                expires, value = self.entries.pop(key)
+            except KeyError:
+                return default
+
+            if expires is not None and expires < time.time():
+                return default
+
+            self.entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        '''
+        Store `value` for `key`, evicting the least recently used entries if
+        the cache is full.
+
+        :param key: tuple of (identity, schemas, prefix, name)
+        :param value: list of signatures
+        '''
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = time.time() + self.ttl
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (expires, value)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, schema=None, name=None):
+        '''
+        Drop the entries for procedure `name` in `schema`, including entries
+        for lists of schemas that contain `schema`. If no `name` is given,
+        all entries for `schema` are dropped, if no `schema` is given the
+        cache is cleared. Full inventories of `schema` are always dropped,
+        as they may contain `name`.
+
+        :param schema: name of the schema
+        :param name: name of the procedure
+        '''
+        with self.lock:
+            if schema is None:
+                self.entries.clear()
+                return
+
+            for key in list(self.entries):
+                if schema not in key[1]:
+                    continue
+                if name is None or key[3] is None or key[3] == name:
+                    del self.entries[key]
+
+    def clear(self):
+        '''
+        Drop all entries.
+        '''
+        self.invalidate()
+
+
+class ResultCache(MetadataCache):
+    '''
+    Cache for the results of procedures that the database declares free of
+    side effects, see :meth:`dbproc.backend.base.Backend.memoize`. Entries
+    are keyed by server identity, schema, arguments and procedure name, so
+    :meth:`invalidate` drops the results of a procedure like it drops its
+    signature.
+
+    Results of ``IMMUTABLE`` (PostgreSQL) and ``DETERMINISTIC`` (MySQL)
+    routines are kept until they expire. Results of ``STABLE`` routines only
+    remain valid within a transaction, if `stable` is set they are cached
+    for the duration of a :meth:`dbproc.backend.base.Backend.session`.
+
+    Cached results are shared by all callers, and should not be modified.
+
+    :param size: maximum number of entries
+    :param ttl: entry lifetime in seconds, ``None`` to never expire
+    :param stable: cache results of stable routines within sessions
+
+    >>> memo = ResultCache(size=4096, ttl=600)
+    >>> wrapped = Wrap(connection, memo=memo)
+    >>> wrapped.convert(100, 'EUR', 'USD')
+    >>> memo.stats()
+    {'hits': 0, 'misses': 1, 'size': 1}
+    '''
+
+    def __init__(self, size=1024, ttl=60, stable=False):
+        super(ResultCache, self).__init__(size, ttl)
+        self.stable = stable
+        self.local = threading.local()
+        self.counters = dict(
+            hits=0,
+            misses=0,
+        )
+
+    def get_scope(self):
+        '''
+        Returns the cache for stable results of the current session, or
+        ``None`` outside of a session.
+
+        :rtype: :class:`MetadataCache`
+        '''
+        return getattr(self.local, 'scope', None)
+
+    def record(self, hit):
+        '''
+        Count a cache hit, or a miss.
+
+        :param hit: bool
+        '''
+        with self.lock:
+            if hit:
+                self.counters['hits'] += 1
+            else:
+                self.counters['misses'] += 1
+
+    @contextlib.contextmanager
+    def scope(self):
+        '''
+        Cache the results of stable routines called by the current thread
+        within the context, unless the thread is already in a scope.
+        '''
+        if not self.stable or self.get_scope() is not None:
+            yield
+            return
+
+        self.local.scope = MetadataCache(self.size, ttl=None)
+        try:
+            yield
+        finally:
+            self.local.scope = None
+
+    def stats(self):
+        '''
+        Returns the number of cache hits, misses and cached results.
+
+        :rtype: dict
+        '''
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update(size=len(self.entries))
+        return stats
+
+
+#: Cache shared by all :class:`dbproc.Wrap` instances by default.
+metadata = MetadataCache()
@@ -0,0 +1,296 @@
+'''
+Generate a static client module for the stored procedures in a schema.
+
+The catalog is inspected once, at generation time, and each procedure
+becomes a method of a ``Client`` class with a real Python signature. The
+procedure signatures are embedded in the module, so creating a client does
+not query the catalog, and the SQL of each call is compiled once when the
+client is created. Calls bind their arguments through the Python signature
+and skip the attribute and procedure lookups of :class:`dbproc.wrap.Wrap`.
+
+On creation, the client compares the catalog fingerprint it was generated
+from with the fingerprint of the database, and warns if the procedures have
+changed since. Regenerate the module to pick up the changes.
+
+Generate a module from the command line::
+
+    python -m dbproc.codegen pgsql 'dbname=test' test_api.py --prefix test_
+
+or from Python with :func:`write`, then use it like::
+
+    >>> from test_api import Client
+    >>> api = Client(connection)
+    >>> api.add(1, 2)
+    3
+
+Parameter names that are not valid Python identifiers, or that are Python
+keywords, get a trailing underscore, unnamed PostgreSQL parameters are
+named ``arg1``, ``arg2``, and so on. Overloaded PostgreSQL functions, and
+procedures with parameters that can not be expressed as a Python signature,
+accept ``*args`` and ``**kwargs`` and are bound at call time.
+'''
+
+import keyword
+import os
+import pprint
+import re
+import warnings
+
+from dbproc.backend.base import Default
+from dbproc.wrap import Wrap
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class Client(object):
+    '''
+    Base class of generated clients. Generated subclasses set
+    :attr:`BACKEND`, :attr:`SCHEMAS`, :attr:`PREFIX`, :attr:`FINGERPRINT`
+    and :attr:`SIGNATURES`.
+
+    :param connection: instance of DB API 2.0 connection, or a
+                       :class:`dbproc.pool.Pool`
+    :param verify: compare the catalog fingerprint with the fingerprint the
+                   client was generated from
+    :param options: backend options, see
+                    :class:`dbproc.backend.base.Backend`
+    '''
+
+    BACKEND = None
+    SCHEMAS = []
+    PREFIX = ''
+    FINGERPRINT = None
+    SIGNATURES = []
+
+    def __init__(self, connection, verify=True, **options):
+        options['cache'] = None
+        options['eager'] = False
+        self.wrapped = Wrap(connection, schema=list(self.SCHEMAS),
+                            prefix=self.PREFIX, **options)
+        self.backend = self.wrapped.backend
+        if self.backend.__class__.__name__ != self.BACKEND:
+            raise TypeError('%s was generated for %s, not %s' % (
+                self.__class__.__name__,
+                self.BACKEND,
+                self.backend.__class__.__name__,
+            ))
+
+        self.backend.load(self.SIGNATURES)
+        self.backend.eager = True
+        self.procedures = self.backend.procedure
+        if verify:
+            self.check()
+
+    def call(self, name, query_args):
+        '''
+        Call the procedure `name` with bound `query_args`.
+
+        :param name: procedure name, including the prefix
+        :param query_args: list of bound arguments
+        '''
+        procedure = self.procedures[name]
+        if self.backend.metrics is not None:
+            return self.backend.metrics.measure(procedure, query_args, {})
+        else:
+            return procedure.invoke(query_args)
+
+    def check(self):
+        '''
+        Warn if the procedures in the database have changed since the client
+        was generated.
+
+        :rtype: bool, ``True`` if the client is up to date
+        '''
+        with self.backend.session():
+            fingerprint = self.backend.fingerprint()
+        if fingerprint != self.FINGERPRINT:
+            warnings.warn('%s was generated for a different version of the '
+                          'procedures in %s, regenerate it' % (
+                              self.__class__.__name__,
+                              ', '.join(self.SCHEMAS),
+                          ))
+            return False
+        return True
+
+    def session(self):
+        '''
+        Make all calls within the context on one connection, see
+        :meth:`dbproc.backend.base.Backend.session`.
+        '''
+        return self.backend.session()
+
+
+def identifier(name, taken=()):
+    '''
+    Returns a valid Python identifier for `name`, that is not a keyword and
+    not in `taken`.
+
+    :param name: str
+    :param taken: collection of str
+    :rtype: str
+    '''
+    if not IDENTIFIER.match(name):
+        name = re.sub(r'[^A-Za-z0-9_]', '_', name)
+        if not IDENTIFIER.match(name):
+            name = '_' + name
+    while keyword.iskeyword(name) or name in taken:
+        name += '_'
+    return name
+
+
+def parameters(procedure):
+    '''
+    Returns the Python parameter list for `procedure`, as pairs of name and
+    default value representation, or ``None`` if the parameters can not be
+    expressed as a Python signature.
+
+    :rtype: list of (str, str or None), or None
+    '''
+    if getattr(procedure, 'param_index', None) is None:
+        return None
+
+    names = {}
+    for name, index in procedure.param_index.iteritems():
+        names[index] = name
+
+    params = []
+    taken = set(['self'])
+    for index, default in enumerate(procedure.param_template):
+        name = identifier(names.get(index) or 'arg%d' % (index + 1), taken)
+        taken.add(name)
+        if default is Default:
+            params.append((name, 'Default'))
+        elif default is None:
+            params.append((name, 'None'))
+        elif params and params[-1][1] is not None:
+            # Required parameter after an optional one
+            return None
+        else:
+            params.append((name, None))
+    return params
+
+
+def generate(backend, class_name='Client', signatures=None, fingerprint=None):
+    '''
+    Returns the source of a client module for the procedures of `backend`.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param class_name: name of the generated client class
+    :param signatures: procedure signatures, if they were already queried
+    :param fingerprint: catalog fingerprint, if it was already queried
+    :rtype: str
+    '''
+    if fingerprint is None:
+        fingerprint = backend.fingerprint()
+    if signatures is None:
+        signatures = backend.signatures()
+    backend.load(signatures)
+
+    lines = [
+        "'''",
+        'Client for the stored procedures in %s, generated by dbproc.codegen.'
+        % (', '.join(backend.schemas),),
+        '',
+        'Do not edit, regenerate this module when the procedures change.',
+        "'''",
+        '',
+        'from dbproc.backend.base import Default',
+        'import dbproc.codegen',
+        '',
+        '',
+        'class %s(dbproc.codegen.Client):' % (class_name,),
+        '    BACKEND = %r' % (backend.__class__.__name__,),
+        '    SCHEMAS = %r' % (list(backend.schemas),),
+        '    PREFIX = %r' % (backend.prefix,),
+        '    FINGERPRINT = %r' % (fingerprint,),
+        '    SIGNATURES = %s' % (
+            pprint.pformat(signatures).replace('\n', '\n    '),
+        ),
+    ]
+
+    taken = set(dir(Client))
+    for name in sorted(backend.procedure):
+        procedure = backend.procedure[name]
+        method = identifier(name[len(backend.prefix):] or name, taken)
+        taken.add(method)
+
+        params = parameters(procedure)
+        if params is None:
+            if hasattr(procedure, 'param_index') and \
+                    procedure.param_index is None:
+                args = '*args'
+            else:
+                args = '*args, **kwargs'
+            signature = args
+            body = 'return self.procedures[%r](%s)' % (name, args)
+        else:
+            signature = ', '.join([
+                default is None and param or '%s=%s' % (param, default)
+                for param, default in params
+            ])
+            body = 'return self.call(%r, [%s])' % (
+                name, ', '.join([param for param, default in params]),
+            )
+
+        lines.extend([
+            '',
+            '    def %s(self%s):' % (method, signature and ', ' + signature),
+            "        '''",
+            '        Call %s.%s.' % (procedure.schema, procedure.proc),
+            "        '''",
+            '        %s' % (body,),
+        ])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write(backend, filename, class_name='Client'):
+    '''
+    Generate a client module for the procedures of `backend` and write it to
+    `filename`.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param filename: path of the module file
+    :param class_name: name of the generated client class
+    :rtype: str, the module source
+    '''
+    source = generate(backend, class_name)
+    temp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(temp, 'w') as handle:
+        handle.write(source)
+    os.rename(temp, filename)
+    return source
+
+
+def main(args=None):
+    import argparse
+    from dbproc.snapshot import connect
+
+    parser = argparse.ArgumentParser(
+        description='Generate a client module for stored procedures',
+    )
+    parser.add_argument('driver', choices=['mysql', 'pgsql'])
+    parser.add_argument('dsn', help='connection string')
+    parser.add_argument('filename', help='path of the module file')
+    parser.add_argument('--schema', action='append', default=None,
+                        help='name of the schema, may be repeated')
+    parser.add_argument('--prefix', default='', help='name prefix')
+    parser.add_argument('--class-name', default='Client',
+                        help='name of the client class')
+    options = parser.parse_args(args)
+
+    connection = connect(options.driver, options.dsn)
+    try:
+        wrapped = Wrap(connection, schema=options.schema,
+                       prefix=options.prefix, cache=None)
+        write(wrapped.backend, options.filename, options.class_name)
+        count = len(wrapped.backend.procedure)
+    finally:
+        connection.close()
+
+    print 'Wrote a client for %d procedures to %s' % (count,
+                                                      options.filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+'''
+Columnar results as NumPy arrays or Arrow record batches.
+
+Rows are fetched in chunks of ``itersize`` rows and each chunk is
+transposed directly into one array per column, no result objects are built
+per row. The array types are derived from the column types in the cursor
+description, see :attr:`dbproc.backend.base.Backend.dtypes`. Columns of
+other types, such as text, are returned as object arrays.
+
+Integer columns that contain ``NULL`` values are returned as floating point
+arrays, with ``NULL`` values as ``nan``, boolean columns as object arrays.
+Date and time columns represent ``NULL`` values as ``NaT``.
+
+Requires `NumPy <http://www.numpy.org/>`_, and for record batches
+`pyarrow <https://arrow.apache.org/>`_, which is only imported when record
+batches are requested.
+
+>>> columns = wrapped.report.columns(2014)
+>>> columns['amount'].sum()
+'''
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from itertools import izip
+
+
+def to_array(values, dtype):
+    '''
+    Returns a NumPy array of `dtype` holding `values`, or an object array if
+    the values do not fit the `dtype`.
+
+    :param values: sequence of column values
+    :param dtype: NumPy dtype, or ``None`` for an object array
+    :rtype: :class:`numpy.ndarray`
+    '''
+    if dtype is not None:
+        kind = numpy.dtype(dtype).kind
+        if kind in 'iub' and None in values:
+            # NULL values, None is converted to nan for numbers, but it would
+            # silently become False for booleans
+            if kind != 'b':
+                return numpy.array(values, dtype=float)
+        else:
+            try:
+                return numpy.array(values, dtype=dtype)
+            except (OverflowError, TypeError, ValueError):
+                pass
+
+    # Assign item by item, sequence values would be unpacked otherwise
+    array = numpy.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = value
+    return array
+
+
+def chunks(backend, cursor):
+    '''
+    Generates the column names and the values of each column, per chunk of
+    rows fetched from `cursor`. Result sets without rows, such as the
+    results of the ``SET`` statements of MySQL procedure calls, are skipped.
+
+    :rtype: iterator of (list of str, list of dtype, list of tuples)
+    '''
+    while not backend.has_rows(cursor):
+        if not backend.next_result(cursor):
+            return
+
+    names = dtypes = None
+    while True:
+        rows = cursor.fetchmany(backend.itersize)
+        if not rows:
+            break
+        if names is None:
+            # Named cursors only have a description after a fetch
+            names = [column[0] for column in cursor.description]
+            dtypes = [backend.dtypes.get(column[1])
+                      for column in cursor.description]
+        yield names, dtypes, izip(*rows)
+
+
+def columns(backend, cursor):
+    '''
+    Fetch the current result of `cursor` into a NumPy array per column.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param cursor: DB API 2.0 cursor
+    :rtype: dict of str to :class:`numpy.ndarray`
+    '''
+    if numpy is None:
+        raise ImportError('Columnar results require the numpy module')
+
+    names = None
+    parts = None
+    for names, dtypes, values in chunks(backend, cursor):
+        if parts is None:
+            parts = [[] for name in names]
+        for index, column in enumerate(values):
+            parts[index].append(to_array(column, dtypes[index]))
+
+    if names is None:
+        if not cursor.description:
+            return {}
+        return dict([
+            (column[0], to_array((), backend.dtypes.get(column[1])))
+            for column in cursor.description
+        ])
+
+    return dict([
+        (name, part[0] if len(part) == 1 else numpy.concatenate(part))
+        for name, part in izip(names, parts)
+    ])
+
+
+def batches(backend, cursor):
+    '''
+    Generates an Arrow record batch per chunk of rows fetched from the
+    current result of `cursor`.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param cursor: DB API 2.0 cursor
+    :rtype: iterator of :class:`pyarrow.RecordBatch`
+    '''
+    try:
+        import pyarrow
+    except ImportError:
+        pyarrow = None
+    if pyarrow is None or numpy is None:
+        raise ImportError('Record batches require the numpy and pyarrow '
+                          'modules')
+
+    for names, dtypes, values in chunks(backend, cursor):
+        arrays = []
+        for index, column in enumerate(values):
+            if dtypes[index] is None:
+                arrays.append(pyarrow.array(list(column)))
+            else:
+                arrays.append(pyarrow.array(to_array(column, dtypes[index]),
+                                            from_pandas=True))
+        yield pyarrow.RecordBatch.from_arrays(arrays, names)
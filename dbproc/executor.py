@@ -0,0 +1,131 @@
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+import sys
+import threading
+from dbproc.wrap import Wrap
+
+
+class AsyncWrap(object):
+    '''
+    Provide a stored procedure wrapper whose calls run on a pool of worker
+    threads and return :class:`concurrent.futures.Future` objects, so they
+    do not block the caller. Each worker uses its own connection, opened by
+    calling `connect`, so concurrent calls scale with the number of
+    `workers` instead of serializing on a single connection. Procedures are
+    inspected once, on a connection owned by the wrapper, and the metadata
+    is shared by all workers.
+
+    The connections of the workers are not exposed, so each call is
+    committed when it succeeds, and rolled back when it fails, like a call
+    on a :class:`dbproc.pool.Pool`.
+
+    In :mod:`asyncio` code, the futures can be awaited using
+    :func:`asyncio.wrap_future`.
+
+    Requires the :mod:`concurrent.futures` module, available for Python 2 as
+    the `futures <https://pypi.python.org/pypi/futures>`_ package.
+
+    :param connect: callable that returns a new DB API 2.0 connection
+    :param workers: number of worker threads
+    :param kwargs: passed to :class:`dbproc.wrap.Wrap`
+
+    >>> wrapped = AsyncWrap(lambda: psycopg2.connect('dbname=test'))
+    >>> future = wrapped.test(...)
+    >>> future.result()
+    ...
+    '''
+
+    def __init__(self, connect, workers=4, **kwargs):
+        if ThreadPoolExecutor is None:
+            raise ImportError('AsyncWrap requires the concurrent.futures '
+                              'module')
+
+        self.connect = connect
+        self.wrapped = Wrap(connect(), **kwargs)
+        self.backend = self.wrapped.backend
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.connections = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        else:
+            return AsyncProcedure(self, getattr(self.wrapped, attr))
+
+    def close(self):
+        '''
+        Wait for pending calls to finish, then close all connections.
+        '''
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+        self.backend.connection.close()
+
+    def run(self, func, args, kwargs):
+        '''
+        Run `func` in a worker thread, using the connection of the worker,
+        and commit the connection if `func` succeeds, or roll it back.
+        '''
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+            with self.lock:
+                self.connections.append(connection)
+
+        with self.backend.bind(connection):
+            try:
+                result = func(*args, **kwargs)
+            except:
+                exc_info = sys.exc_info()
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+        connection.commit()
+        return result
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Schedule `func` to be called with `args` and `kwargs` in a worker
+        thread.
+
+        :rtype: :class:`concurrent.futures.Future`
+        '''
+        return self.executor.submit(self.run, func, args, kwargs)
+
+
+class AsyncProcedure(object):
+    '''
+    Callable wrapper for a stored procedure of an :class:`AsyncWrap`, calls
+    return :class:`concurrent.futures.Future` objects.
+    '''
+
+    def __init__(self, wrapped, procedure):
+        self.wrapped = wrapped
+        self.procedure = procedure
+
+    def __call__(self, *args, **kwargs):
+        return self.wrapped.submit(self.procedure, *args, **kwargs)
+
+    def many(self, iterable, chunk_size=None):
+        '''
+        Schedule a batched call, see :meth:`dbproc.procedure.Procedure.many`.
+
+        :rtype: :class:`concurrent.futures.Future`
+        '''
+        return self.wrapped.submit(self.procedure.many, iterable, chunk_size)
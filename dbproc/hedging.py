@@ -0,0 +1,322 @@
+'''
+Hedged calls to read only procedures.
+
+A call that takes longer than most calls to the same procedure is often
+stuck behind something on its connection or server, rather than slow by
+itself. A :class:`Hedging` policy sends a duplicate of such a call on
+another connection, and returns whichever result arrives first:
+
+>>> wrapped = Wrap(pool, hedging=Hedging(percentile=0.95))
+>>> wrapped.get_user(42)    # STABLE, hedged after its p95 latency
+
+Only calls to read only procedures are hedged. A call runs on the calling
+thread, on a connection checked out from the connection pool of the
+backend, or of the next replica if the backend has ``replicas``. Once the
+call is late, the :data:`dbproc.backend.base.WATCHDOG` starts the duplicate
+call on a worker thread, on another connection. The call that returns
+first cancels the other one. Plain replica connections are shared by the
+threads of the policy, so the backend must be ``threadsafe``.
+
+Calls are only hedged on backends that can cancel a running statement, see
+:meth:`dbproc.backend.base.Backend.can_cancel`. They are not hedged within
+a session, or on a connection bound with
+:meth:`dbproc.backend.base.Backend.bind`.
+
+Requires the :mod:`concurrent.futures` module, available for Python 2 as
+the `futures <https://pypi.python.org/pypi/futures>`_ package.
+'''
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+import collections
+import contextlib
+import sys
+import threading
+import time
+from dbproc.backend.base import WATCHDOG
+
+
+class Race(object):
+    '''
+    State of a hedged call: the connections of the call and its duplicate,
+    which of them finished, and which returned first. The call is attempt
+    0, the duplicate is attempt 1.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = [None, None]
+        self.cancels = [None, None]
+        self.done = [False, False]
+        self.winner = None
+        self.future = None
+
+    def finish(self, index, backend, success):
+        '''
+        Record that attempt `index` finished. The first attempt that
+        returns has the other one cancelled by the watchdog, without
+        waiting for it. An attempt that is being cancelled waits for the
+        cancellation before it releases its connection.
+        '''
+        with self.lock:
+            self.connections[index] = None
+            self.done[index] = True
+            if success and self.winner is None:
+                self.winner = index
+                other = self.connections[1 - index]
+                if other is not None:
+                    self.cancels[1 - index] = WATCHDOG.watch(
+                        time.time(), backend.cancel, other,
+                    )
+            entry = self.cancels[index]
+        if entry is not None:
+            WATCHDOG.unwatch(entry)
+
+    def start(self, index, connection):
+        '''
+        Record the `connection` of attempt `index`.
+
+        :rtype: bool, ``False`` if the other attempt already returned
+        '''
+        with self.lock:
+            if self.winner is not None:
+                return False
+            self.connections[index] = connection
+            return True
+
+
+class Window(object):
+    '''
+    Latencies of the last calls to a procedure, and their percentile, which
+    is computed again every `interval` calls.
+    '''
+
+    def __init__(self, size, interval):
+        self.samples = collections.deque(maxlen=size)
+        self.interval = interval
+        self.stale = 0
+        self.value = None
+
+
+class Hedging(object):
+    '''
+    Hedge calls to read only procedures that did not finish within the
+    `percentile` of the latencies of the last `window` calls to the same
+    procedure. Calls are not hedged until `min_samples` latencies were
+    recorded, unless a fixed `delay` is given. Limit hedging to some
+    procedures by passing their names as `routines`.
+
+    Duplicate calls run on `workers` threads.
+
+    :param percentile: fraction of calls that are not hedged
+    :param delay: fixed delay in seconds, instead of the percentile
+    :param min_samples: number of latencies needed to compute the percentile
+    :param window: number of latencies kept per procedure
+    :param workers: number of worker threads
+    :param routines: names of the procedures to hedge, default all
+    '''
+
+    def __init__(self, percentile=0.95, delay=None, min_samples=20,
+            window=200, workers=8, routines=None):
+        if ThreadPoolExecutor is None:
+            raise ImportError('Hedging requires the concurrent.futures '
+                              'module')
+        if not 0 < percentile < 1:
+            raise ValueError('Percentile must be between 0 and 1')
+
+        self.percentile = percentile
+        self.delay = delay
+        self.min_samples = min_samples
+        self.window = window
+        self.routines = routines is not None and set(routines) or None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.counters = dict(calls=0, hedged=0, won=0)
+
+    def accepts(self, procedure):
+        '''
+        Check if the call to `procedure` can be hedged.
+
+        :param procedure: instance of :class:`dbproc.procedure.Procedure`
+        :rtype: bool
+        '''
+        if not procedure.read_only:
+            return False
+        elif self.routines is not None and procedure.proc not in self.routines:
+            return False
+
+        backend = procedure.backend
+        if getattr(backend.local, 'connection', None) or \
+                getattr(backend.local, 'sessions', 0) or \
+                not backend.can_cancel():
+            return False
+        elif backend.replicas is not None:
+            # Both attempts are routed like the call would be
+            return backend.replicas.accepts(procedure)
+        else:
+            return backend.pool is not None
+
+    def attempt(self, procedure, query_args, race, index):
+        '''
+        Call `procedure` with bound `query_args` as attempt `index` of the
+        `race`, on a connection of its own.
+        '''
+        backend = procedure.backend
+        with self.checkout(backend) as connection:
+            if not race.start(index, connection):
+                return None
+            try:
+                result = procedure.run(query_args)
+            except Exception:
+                race.finish(index, backend, False)
+                raise
+            race.finish(index, backend, True)
+            return result
+
+    @contextlib.contextmanager
+    def checkout(self, backend):
+        '''
+        Bind a connection of the next replica, or of the pool of `backend`,
+        for the calls made by the current thread within the context.
+        '''
+        if backend.replicas is not None:
+            with backend.replicas.checkout(backend) as connection:
+                yield connection
+        else:
+            with backend.session() as connection:
+                yield connection
+
+    def close(self):
+        '''
+        Wait for pending calls to finish, and stop the worker threads.
+        '''
+        self.executor.shutdown(wait=True)
+
+    def count(self, name):
+        '''
+        Increment the counter `name` of :meth:`stats`.
+        '''
+        with self.lock:
+            self.counters[name] += 1
+
+    def hedge(self, procedure, query_args, race, timeout):
+        '''
+        Start the duplicate call of `race` on a worker thread, called by the
+        watchdog when the call is late.
+        '''
+        with race.lock:
+            if race.done[0]:
+                return
+            race.future = self.executor.submit(self.second, procedure,
+                                               query_args, race, timeout)
+        self.count('hedged')
+
+    def record(self, procedure, duration):
+        '''
+        Record the latency of a call to `procedure`.
+        '''
+        key = (procedure.schema, procedure.proc)
+        with self.lock:
+            window = self.latencies.get(key)
+            if window is None:
+                window = self.latencies[key] = Window(
+                    self.window, max(1, self.window // 20),
+                )
+            window.samples.append(duration)
+            window.stale += 1
+
+    def run(self, procedure, query_args):
+        '''
+        Call `procedure` with bound `query_args` on the current thread, and
+        hedge the call if it does not finish within :meth:`threshold`.
+        '''
+        self.count('calls')
+        backend = procedure.backend
+        delay = self.threshold(procedure)
+        start = time.time()
+        if delay is None:
+            # Not enough samples yet
+            with self.checkout(backend):
+                result = procedure.run(query_args)
+            self.record(procedure, time.time() - start)
+            return result
+
+        race = Race()
+        entry = WATCHDOG.watch(start + delay, self.hedge, procedure,
+                               query_args, race, backend.get_timeout())
+        try:
+            result = self.attempt(procedure, query_args, race, 0)
+        except Exception:
+            exc_info = sys.exc_info()
+            # The duplicate call is not started after this, the call failed
+            # or was cancelled because the duplicate returned first
+            WATCHDOG.unwatch(entry)
+            if race.future is None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            try:
+                result, sample = race.future.result()
+            except Exception:
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+            self.count('won')
+            # Report the phases and rows of the duplicate call
+            if backend.metrics is not None:
+                outer = getattr(backend.metrics.local, 'sample', None)
+                if outer is not None:
+                    outer[:] = sample
+        else:
+            WATCHDOG.unwatch(entry)
+
+        self.record(procedure, time.time() - start)
+        return result
+
+    def second(self, procedure, query_args, race, timeout):
+        '''
+        Run the duplicate call of `race` with the `timeout` of the call.
+        Returns its result, and its sample for :mod:`dbproc.metrics`.
+        '''
+        backend = procedure.backend
+        sample = [0.0, 0.0, 0, 0]
+        if backend.metrics is not None:
+            backend.metrics.local.sample = sample
+        try:
+            with backend.deadline(timeout):
+                return self.attempt(procedure, query_args, race, 1), sample
+        finally:
+            if backend.metrics is not None:
+                backend.metrics.local.sample = None
+
+    def stats(self):
+        '''
+        Returns the number of calls, the number of hedged calls and the
+        number of hedged calls that returned first.
+
+        :rtype: dict
+        '''
+        with self.lock:
+            return dict(self.counters)
+
+    def threshold(self, procedure):
+        '''
+        Returns the delay in seconds after which a call to `procedure` is
+        hedged, or ``None`` if there are not enough samples.
+
+        :rtype: float or None
+        '''
+        if self.delay is not None:
+            return self.delay
+
+        window = self.latencies.get((procedure.schema, procedure.proc))
+        if window is None or len(window.samples) < self.min_samples:
+            return None
+        elif window.value is None or window.stale >= window.interval:
+            with self.lock:
+                ordered = sorted(window.samples)
+                window.stale = 0
+            window.value = ordered[min(int(len(ordered) * self.percentile),
+                                       len(ordered) - 1)]
+        return window.value
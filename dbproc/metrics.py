@@ -0,0 +1,251 @@
+'''
+Per procedure call metrics.
+
+A :class:`Metrics` registry passed to :class:`dbproc.wrap.Wrap` records for
+each procedure the number of calls, failed calls and returned rows, and
+histograms of the call latency, split into the phases:
+
+============ ===============================================================
+``bind``     binding the arguments to the parameters
+``execute``  sending the call to the server and waiting for the result
+``fetch``    fetching the result and building the result objects
+``total``    the whole call, including checking out a pooled connection
+============ ===============================================================
+
+Calls answered from the result memo only have a ``bind`` and ``total``
+latency. Batched calls made through ``many`` and streamed calls are not
+recorded.
+
+>>> metrics = Metrics()
+>>> wrapped = Wrap(connection, metrics=metrics)
+>>> wrapped.test(...)
+>>> metrics.snapshot()['public.test']['calls']
+1
+>>> print metrics.prometheus()
+'''
+
+import bisect
+import threading
+import time
+
+#: Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('bind', 'execute', 'fetch', 'total')
+
+
+class Histogram(object):
+    '''
+    Latency histogram with fixed buckets.
+
+    :param buckets: sorted upper bounds of the buckets
+    '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # The last count is for values above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        '''
+        Returns the cumulative bucket counts, as pairs of upper bound and
+        count, and the count and sum of all observed values.
+
+        :rtype: dict
+        '''
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return dict(buckets=cumulative, count=self.count, sum=self.sum)
+
+
+class RoutineMetrics(object):
+    '''
+    Metrics of a single procedure.
+    '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency = dict([(phase, Histogram(buckets)) for phase in PHASES])
+
+    def snapshot(self):
+        return dict(
+            calls=self.calls,
+            errors=self.errors,
+            rows=self.rows,
+            latency=dict([
+                (phase, histogram.snapshot())
+                for phase, histogram in self.latency.iteritems()
+            ]),
+        )
+
+
+class Metrics(object):
+    '''
+    Thread safe registry of procedure call metrics, keyed by the schema
+    qualified procedure name. Recording a call takes a few timer reads and
+    a single lock acquisition.
+
+    :param buckets: upper bounds of the latency histogram buckets, in
+                    seconds
+    '''
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.routines = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def execute(self, procedure, cursor, query_args):
+        '''
+        Execute the call of `procedure` with bound `query_args` on `cursor`
+        and fetch the result, timing both phases.
+        '''
+        start = time.time()
+        procedure.execute(cursor, query_args)
+        executed = time.time()
+        result = procedure.fetch(cursor)
+        sample = getattr(self.local, 'sample', None)
+        if sample is not None:
+            sample[0] += executed - start
+            sample[1] += time.time() - executed
+            sample[2] += max(cursor.rowcount, 0)
+            sample[3] += 1
+        return result
+
+    def measure(self, procedure, args, kwargs):
+        '''
+        Call `procedure` with positional `args` and keyword `kwargs`, and
+        record the call.
+        '''
+        outer = getattr(self.local, 'sample', None)
+        sample = self.local.sample = [0.0, 0.0, 0, 0]
+        start = time.time()
+        try:
+            query_args = procedure.bind(args, kwargs)
+            bound = time.time()
+            result = procedure.invoke(query_args)
+        except Exception:
+            self.local.sample = outer
+            self.record(procedure, None, None, sample, error=True)
+            raise
+
+        end = time.time()
+        self.local.sample = outer
+        self.record(procedure, bound - start, end - start, sample)
+        return result
+
+    def record(self, procedure, bind, total, sample, error=False):
+        '''
+        Record a call of `procedure`.
+
+        :param bind: binding latency in seconds
+        :param total: call latency in seconds
+        :param sample: list of execute latency, fetch latency, row count and
+                       number of executed queries
+        :param error: ``True`` if the call failed
+        '''
+        key = '%s.%s' % (procedure.schema, procedure.proc)
+        with self.lock:
+            routine = self.routines.get(key)
+            if routine is None:
+                routine = self.routines[key] = RoutineMetrics(self.buckets)
+
+            routine.calls += 1
+            if error:
+                routine.errors += 1
+                return
+
+            routine.rows += sample[2]
+            latency = routine.latency
+            latency['bind'].observe(bind)
+            latency['total'].observe(total)
+            if sample[3]:
+                latency['execute'].observe(sample[0])
+                latency['fetch'].observe(sample[1])
+
+    def reset(self):
+        '''
+        Drop all recorded metrics.
+        '''
+        with self.lock:
+            self.routines.clear()
+
+    def snapshot(self):
+        '''
+        Returns the metrics of all procedures, keyed by the schema qualified
+        procedure name. For each procedure the number of ``calls``,
+        ``errors`` and ``rows`` is returned, and the ``latency`` histogram
+        for each phase.
+
+        :rtype: dict
+        '''
+        with self.lock:
+            return dict([
+                (key, routine.snapshot())
+                for key, routine in self.routines.iteritems()
+            ])
+
+    def prometheus(self, prefix='dbproc'):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+
+        :param prefix: metric name prefix
+        :rtype: str
+        '''
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, field in (('calls_total', 'counter', 'calls'),
+                                  ('errors_total', 'counter', 'errors'),
+                                  ('rows_total', 'counter', 'rows')):
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for key in sorted(snapshot):
+                lines.append('%s_%s{routine="%s"} %d' % (
+                    prefix, name, escape_label(key), snapshot[key][field],
+                ))
+
+        name = '%s_call_duration_seconds' % prefix
+        lines.append('# TYPE %s histogram' % name)
+        for key in sorted(snapshot):
+            for phase in PHASES:
+                histogram = snapshot[key]['latency'][phase]
+                labels = 'routine="%s",phase="%s"' % (escape_label(key), phase)
+                for bound, count in histogram['buckets']:
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        name, labels, format_bound(bound), count,
+                    ))
+                lines.append('%s_sum{%s} %r' % (name, labels,
+                                                histogram['sum']))
+                lines.append('%s_count{%s} %d' % (name, labels,
+                                                  histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    '''
+    Escape `value` for use as Prometheus label value.
+
+    :param value: str
+    :rtype: str
+    '''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+                                                                   '\\n')
+
+
+def format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    else:
+        return repr(bound)
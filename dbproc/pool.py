@@ -0,0 +1,206 @@
+import contextlib
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    '''
+    Raised when no connection became available within the checkout timeout.
+    '''
+    pass
+
+
+def ping(connection):
+    '''
+    Default health check, runs a trivial query on `connection`.
+
+    :param connection: instance of DB API 2.0 connection
+    :rtype: bool
+    '''
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+        return True
+    except Exception:
+        return False
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+class Pool(object):
+    '''
+    Thread safe pool of DB API 2.0 connections, which can be passed to
+    :class:`dbproc.wrap.Wrap` instead of a connection.
+
+    At most `size` connections are opened, by calling `connect`. A checkout
+    waits at most `timeout` seconds for a connection to be released, before
+    :class:`PoolTimeout` is raised. Connections that were idle for longer
+    than `check_interval` seconds are health checked by calling `check`
+    before they are handed out, and replaced if the check fails. Released
+    connections are rolled back.
+
+    :param connect: callable that returns a new DB API 2.0 connection
+    :param size: maximum number of connections
+    :param timeout: checkout timeout in seconds, ``None`` to wait forever
+    :param check: health check callable, ``None`` to disable health checks
+    :param check_interval: idle time in seconds after which to check
+
+    >>> pool = Pool(lambda: psycopg2.connect('dbname=test'), size=20)
+    >>> wrapped = Wrap(pool)
+    '''
+
+    def __init__(self, connect, size=10, timeout=30, check=ping,
+            check_interval=30):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.check = check
+        self.check_interval = check_interval
+        self.count = 0
+        self.idle = []
+        self.condition = threading.Condition()
+        self.counters = dict(
+            checkouts=0,
+            created=0,
+            discarded=0,
+            timeouts=0,
+            waits=0,
+        )
+
+    def acquire(self):
+        '''
+        Check out a connection, it must be returned with :meth:`release`.
+
+        :rtype: DB API 2.0 connection
+        '''
+        while True:
+            connection, idle_since = self.reserve()
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    with self.condition:
+                        self.count -= 1
+                        self.condition.notify()
+                    raise
+                with self.condition:
+                    self.counters['created'] += 1
+
+            elif self.check is not None and \
+                    time.time() - idle_since > self.check_interval and \
+                    not self.check(connection):
+                self.discard(connection)
+                continue
+
+            with self.condition:
+                self.counters['checkouts'] += 1
+            return connection
+
+    def close(self):
+        '''
+        Close all idle connections.
+        '''
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.count -= len(idle)
+            self.condition.notify_all()
+        for connection, idle_since in idle:
+            self.close_connection(connection)
+
+    def close_connection(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def connection(self):
+        '''
+        Check out a connection for the duration of the context.
+
+        >>> with pool.connection() as connection:
+        ...     cursor = connection.cursor()
+        '''
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def discard(self, connection):
+        '''
+        Close a checked out `connection` and remove it from the pool.
+        '''
+        self.close_connection(connection)
+        with self.condition:
+            self.count -= 1
+            self.counters['discarded'] += 1
+            self.condition.notify()
+
+    def release(self, connection):
+        '''
+        Return a checked out `connection` to the pool. The connection is
+        rolled back, or discarded if that fails.
+        '''
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+
+        with self.condition:
+            self.idle.append((connection, time.time()))
+            self.condition.notify()
+
+    def reserve(self):
+        '''
+        Take an idle connection, or reserve a slot for a new connection, in
+        which case ``None`` is returned as connection.
+
+        :rtype: tuple of (connection, idle since)
+        '''
+        with self.condition:
+            if not self.idle and self.count >= self.size:
+                self.counters['waits'] += 1
+                if self.timeout is not None:
+                    deadline = time.time() + self.timeout
+                while not self.idle and self.count >= self.size:
+                    if self.timeout is None:
+                        self.condition.wait()
+                        continue
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout('No connection available within '
+                                          '%s seconds' % (self.timeout,))
+                    self.condition.wait(remaining)
+
+            if self.idle:
+                # Most recently used first, so surplus connections go idle
+                return self.idle.pop()
+            else:
+                self.count += 1
+                return (None, None)
+
+    def stats(self):
+        '''
+        Returns the pool statistics: the number of connections that are
+        opened, idle and in use, and counters for checkouts, created and
+        discarded connections, checkouts that had to wait and checkouts
+        that timed out.
+
+        :rtype: dict
+        '''
+        with self.condition:
+            stats = dict(self.counters)
+            stats.update(
+                size=self.count,
+                idle=len(self.idle),
+                in_use=self.count - len(self.idle),
+            )
+        return stats
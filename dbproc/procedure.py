@@ -1,6 +1,584 @@
+import itertools
+import sys
+
+from dbproc.backend.base import Default, Empty
+
+
 class Procedure(object):
+    '''
+    Base class for callable stored procedure wrappers.
+
+    A call binds the arguments to the procedure parameters using the plan
+    prepared by :meth:`compile`, then runs :meth:`execute` and :meth:`fetch`
+    on a fresh cursor, in a session of the backend if it uses a pool.
+
+    The :attr:`volatility` of the procedure is ``immutable``, ``stable`` or
+    ``volatile``, as declared in the database. Results of immutable and
+    stable procedures can be memoized, see
+    :meth:`dbproc.backend.base.Backend.memoize`. Procedures that do not
+    modify data are :attr:`read_only`, calls to these can be routed to
+    replicas, see :mod:`dbproc.replicas`.
+
+    Use :meth:`many` to call the procedure for a sequence of arguments,
+    backends may send these calls to the server in batches. Use
+    :meth:`stream` to iterate over large results without loading them into
+    memory at once. Use :meth:`results` to read all results of procedures
+    that return several result sets. Use :meth:`columns` or :meth:`batches`
+    to fetch large results into NumPy arrays or Arrow record batches.
+    '''
+
+    param_index = None
+    param_template = ()
+    param_required = ()
+    read_only = False
+    volatility = 'volatile'
+
     def __init__(self, backend, *args, **kwargs):
         self.backend = backend
 
     def __call__(self, *args, **kwargs):
+        if self.backend.metrics is not None:
+            return self.backend.metrics.measure(self, args, kwargs)
+        else:
+            return self.invoke(self.bind(args, kwargs))
+
+    def batches(self, *args, **kwargs):
+        '''
+        Call the procedure and return an iterator over Arrow record batches
+        of ``itersize`` rows, fetched from a server side cursor, see
+        :mod:`dbproc.columnar`.
+
+        :rtype: iterator of :class:`pyarrow.RecordBatch`
+        '''
+        # Imported on use, NumPy and pyarrow are slow to import
+        import dbproc.columnar
+        query_args = self.bind(args, kwargs)
+        self.record_write()
+        with self.backend.session():
+            cursor = self.backend.get_stream_cursor()
+            try:
+                with self.backend.enforce(self.backend.get_timeout()):
+                    self.execute(cursor, query_args)
+                    for batch in dbproc.columnar.batches(self.backend,
+                                                         cursor):
+                        yield batch
+            finally:
+                cursor.close()
+
+    def bind(self, args, kwargs):
+        '''
+        Bind positional `args` and keyword `kwargs` to the procedure
+        parameters.
+
+        :param args: tuple
+        :param kwargs: dict
+        :rtype: list
+        '''
+        if self.param_index is None:
+            if kwargs:
+                raise TypeError('%s() does not support named arguments' %
+                                (self.proc,))
+            return list(args)
+
+        needs = len(self.param_template)
+        given = len(args)
+        if given == needs and not kwargs:
+            return list(args)
+        elif given > needs:
+            raise TypeError('%s() takes at most %d arguments (%d given)' %
+                            (self.proc, needs, given))
+
+        query_args = list(args)
+        query_args.extend(self.param_template[given:])
+        for name, value in kwargs.iteritems():
+            index = self.param_index.get(name)
+            if index is None:
+                raise TypeError("%s() got an unexpected keyword argument "
+                                "'%s'" % (self.proc, name))
+            elif index < given:
+                raise TypeError("%s() got multiple values for keyword "
+                                "argument '%s'" % (self.proc, name))
+            query_args[index] = value
+
+        for index in self.param_required:
+            if query_args[index] is Empty:
+                raise TypeError('%s() takes %s %d arguments (%d given)' % (
+                    self.proc,
+                    'exactly' if needs == len(self.param_required) else
+                    'at least',
+                    len(self.param_required),
+                    given + len(kwargs),
+                ))
+
+        return query_args
+
+    def bind_item(self, item):
+        '''
+        Bind one item passed to :meth:`many`, a `dict` is bound as keyword
+        arguments, anything else as positional arguments.
+
+        :rtype: list
+        '''
+        if isinstance(item, dict):
+            return self.bind((), item)
+        else:
+            return self.bind(tuple(item), {})
+
+    def call(self, query_args):
+        '''
+        Call the procedure with bound `query_args`, on a cursor from
+        :meth:`dbproc.backend.base.Backend.acquire_cursor`.
+
+        :param query_args: list of bound arguments
+        '''
+        self.record_write()
+        cursor = self.backend.acquire_cursor()
+        timeout = self.backend.get_timeout()
+        try:
+            if timeout is not None:
+                with self.backend.enforce(timeout):
+                    result = self.execute_fetch(cursor, query_args)
+            else:
+                result = self.execute_fetch(cursor, query_args)
+        except:
+            self.backend.release_cursor(cursor, error=True)
+            raise
+
+        self.backend.release_cursor(cursor)
+        return result
+
+    def columns(self, *args, **kwargs):
+        '''
+        Call the procedure and return the result as a NumPy array per
+        column. Rows are fetched from a server side cursor in chunks of
+        ``itersize`` rows, see :mod:`dbproc.columnar`.
+
+        :rtype: dict of str to :class:`numpy.ndarray`
+
+        >>> wrapped.report.columns(2014)['amount'].mean()
+        '''
+        # Imported on use, NumPy is slow to import
+        import dbproc.columnar
+        query_args = self.bind(args, kwargs)
+        self.record_write()
+        with self.backend.session():
+            cursor = self.backend.get_stream_cursor()
+            try:
+                with self.backend.enforce(self.backend.get_timeout()):
+                    self.execute(cursor, query_args)
+                    return dbproc.columnar.columns(self.backend, cursor)
+            finally:
+                cursor.close()
+
+    def compile(self, param_names, optional=(), defaults=0):
+        '''
+        Prepare the argument binding plan for the parameters `param_names`,
+        the parameters listed in `optional` default to ``None``. The last
+        `defaults` parameters have a default value on the server, omitted
+        arguments for these are bound as :class:`Default`.
+
+        :param param_names: list of str
+        :param optional: collection of str
+        :param defaults: int
+        '''
+        self.param_index = {}
+        self.param_template = []
+        self.param_required = []
+        for index, name in enumerate(param_names):
+            if name is not None:
+                self.param_index[name] = index
+            if index >= len(param_names) - defaults:
+                self.param_template.append(Default)
+            elif name is not None and name in optional:
+                self.param_template.append(None)
+            else:
+                self.param_template.append(Empty)
+                self.param_required.append(index)
+
+    def execute(self, cursor, query_args):
+        '''
+        Execute the procedure call using `cursor`.
+
+        :param cursor: DB API 2.0 cursor
+        :param query_args: list of bound arguments
+        '''
+        raise NotImplementedError
+
+    def explain(self, cursor, query_args):
+        '''
+        Returns the query plan of the procedure call with `query_args`, as
+        reported by the server, or ``None`` if the call can not be
+        explained.
+
+        :param cursor: DB API 2.0 cursor
+        :param query_args: list of bound arguments
+        '''
+        return None
+
+    def fetch_rows(self, cursor):
+        '''
+        Fetch all rows of the current result from `cursor`, built by the row
+        factory of the backend.
+
+        :param cursor: DB API 2.0 cursor
+        '''
+        if cursor.description is None:
+            return []
+        rows = cursor.fetchall()
+        return self.backend.get_rows(cursor.description).rows(rows)
+
+    def execute_fetch(self, cursor, query_args):
+        '''
+        Execute the procedure call with `query_args` on `cursor`, and fetch
+        the result, recorded in the metrics of the backend if it has any.
+        '''
+        if self.backend.metrics is not None:
+            return self.backend.metrics.execute(self, cursor, query_args)
+        self.execute(cursor, query_args)
+        return self.fetch(cursor)
+
+    def execute_many(self, cursor, batch):
+        '''
+        Execute the procedure call for each list of bound arguments in
+        `batch` and return the results in order. By default each call is
+        sent to the server by itself, backends override this to send the
+        whole batch in one query.
+
+        :param cursor: DB API 2.0 cursor
+        :param batch: list of lists of bound arguments
+        :rtype: list
+        '''
+        results = []
+        for query_args in batch:
+            self.execute(cursor, query_args)
+            results.append(self.fetch(cursor))
+        return results
+
+    def fetch(self, cursor):
+        '''
+        Fetch the result of the procedure call from `cursor`.
+
+        :param cursor: DB API 2.0 cursor
+        '''
         raise NotImplementedError
+
+    def many(self, iterable, chunk_size=None):
+        '''
+        Call the procedure for each item in `iterable`, items are tuples of
+        positional arguments or dicts of keyword arguments. The calls are
+        sent to the server in chunks of `chunk_size` items, the default is
+        taken from the backend.
+
+        :param iterable: iterable of tuples or dicts
+        :param chunk_size: number of calls per batch
+        :rtype: list
+
+        >>> wrapped.add.many([(1, 2), (3, 4), dict(a=5, b=6)])
+        [3, 7, 11]
+        '''
+        chunk_size = chunk_size or self.backend.chunk_size
+        iterator = iter(iterable)
+        results = []
+        self.record_write()
+        with self.backend.session():
+            cursor = self.backend.acquire_cursor()
+            timeout = self.backend.get_timeout()
+            try:
+                while True:
+                    batch = [
+                        self.bind_item(item)
+                        for item in itertools.islice(iterator, chunk_size)
+                    ]
+                    if not batch:
+                        break
+                    # The timeout applies to each chunk, like on the server
+                    with self.backend.enforce(timeout):
+                        results.extend(self.execute_many(cursor, batch))
+            except:
+                self.backend.release_cursor(cursor, error=True)
+                raise
+            self.backend.release_cursor(cursor)
+
+        return results
+
+    def record_write(self):
+        '''
+        Remember a call to the procedure for the `read_your_writes` window
+        of the replicas of the backend, see
+        :meth:`dbproc.replicas.Replicas.record`.
+        '''
+        if self.backend.replicas is not None:
+            self.backend.replicas.record(self)
+
+    def results(self, *args, **kwargs):
+        '''
+        Call the procedure and return its result sets, see
+        :class:`ResultSets`. Rows are fetched from a client side buffer.
+
+        :rtype: :class:`ResultSets`
+
+        >>> with wrapped.order.results(42) as results:
+        ...     header = next(results).all()[0]
+        ...     lines = list(next(results))
+        '''
+        return ResultSets(self, self.bind(args, kwargs))
+
+    def run(self, query_args):
+        '''
+        Call the procedure with bound `query_args`, on a replica if the
+        backend routes the call to one, and in a session of the backend if
+        it uses a pool or is thread safe.
+
+        :param query_args: list of bound arguments
+        '''
+        if self.backend.hedging is not None and \
+                self.backend.hedging.accepts(self):
+            return self.backend.hedging.run(self, query_args)
+        elif self.backend.replicas is not None and \
+                self.backend.replicas.accepts(self):
+            return self.backend.replicas.run(self, query_args)
+        elif self.backend.slowlog is not None:
+            return self.backend.slowlog.measure(self, query_args)
+        elif self.backend.pool is None and self.backend.lock is None:
+            return self.call(query_args)
+
+        with self.backend.session():
+            return self.call(query_args)
+
+    def stream_results(self, *args, **kwargs):
+        '''
+        Like :meth:`results`, but rows are read from the server as they are
+        fetched, so large result sets are not buffered.
+
+        :rtype: :class:`ResultSets`
+        '''
+        return ResultSets(self, self.bind(args, kwargs), stream=True)
+
+    def stream(self, *args, **kwargs):
+        '''
+        Call the procedure and return an iterator over the resulting rows.
+        Rows are fetched from a server side cursor in chunks of ``itersize``
+        rows, as configured on the backend, so memory use does not depend
+        on the size of the result.
+
+        :rtype: iterator
+
+        >>> for row in wrapped.report.stream(2014):
+        ...     print row
+        '''
+        return self.iterate(self.bind(args, kwargs))
+
+    def with_timeout(self, timeout):
+        '''
+        Returns a callable that calls the procedure with `timeout`, see
+        :meth:`dbproc.backend.base.Backend.deadline`.
+
+        :param timeout: seconds, ``None`` to wait forever
+
+        >>> wrapped.report.with_timeout(2.0)(2014)
+        '''
+        def call(*args, **kwargs):
+            with self.backend.deadline(timeout):
+                return self(*args, **kwargs)
+        return call
+
+    def invoke(self, query_args):
+        '''
+        Call the procedure with bound `query_args`, or return a memoized
+        result.
+
+        :param query_args: list of bound arguments
+        '''
+        if self.volatility != 'volatile' and self.backend.memo is not None:
+            return self.backend.memoize(self, query_args)
+        else:
+            return self.run(query_args)
+
+    def iterate(self, query_args):
+        '''
+        Generator behind :meth:`stream`, for already bound `query_args`.
+        '''
+        self.record_write()
+        with self.backend.session():
+            cursor = self.backend.get_stream_cursor()
+            try:
+                with self.backend.enforce(self.backend.get_timeout()):
+                    self.execute(cursor, query_args)
+                    factory = None
+                    while True:
+                        rows = cursor.fetchmany(self.backend.itersize)
+                        if not rows:
+                            break
+                        if factory is None:
+                            # Named cursors only have a description after a
+                            # fetch
+                            factory = self.backend.get_rows(
+                                cursor.description)
+                        for row in rows:
+                            yield factory.row(row)
+            finally:
+                cursor.close()
+
+
+class ResultSets(object):
+    '''
+    Lazy sequence of the result sets of a procedure call, as returned by
+    :meth:`Procedure.results`. Iterating yields a :class:`ResultSet` for
+    each result that has rows, results of statements without rows are
+    skipped. A result set can only be read until the next one is requested.
+
+    The connection is held until all result sets were requested, or until
+    :meth:`close` is called, which discards the unread rows and result sets
+    so the connection can be used again. Use the result sets as context
+    manager to ensure they are closed. The timeout of the call lasts until
+    the result sets are closed.
+
+    :param procedure: instance of :class:`Procedure`
+    :param query_args: list of bound arguments
+    :param stream: read rows from the server as they are fetched
+    '''
+
+    def __init__(self, procedure, query_args, stream=False):
+        self.backend = procedure.backend
+        procedure.record_write()
+        self.session = self.backend.session()
+        self.session.__enter__()
+        self.deadline = self.backend.enforce(self.backend.get_timeout())
+        self.deadline.__enter__()
+        try:
+            if stream:
+                self.cursor = self.backend.get_stream_cursor()
+            else:
+                self.cursor = self.backend.get_cursor(plain=True)
+            procedure.execute(self.cursor, query_args)
+        except:
+            exc_info = sys.exc_info()
+            self.exit(exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self.current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close(exc_info)
+
+    def __iter__(self):
+        return self
+
+    def close(self, exc_info=(None, None, None)):
+        '''
+        Discard the unread rows and result sets, and release the connection.
+        '''
+        if self.cursor is None:
+            return
+
+        try:
+            if exc_info[0] is None:
+                while self.skip():
+                    pass
+            self.cursor.close()
+        except:
+            exc_info = sys.exc_info()
+            self.cursor = None
+            self.exit(exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self.cursor = None
+        self.exit(exc_info)
+
+    def exit(self, exc_info):
+        '''
+        Leave the timeout and the session of the call, raises
+        :class:`dbproc.backend.base.CallTimeout` if the error in `exc_info`
+        was caused by the timeout.
+        '''
+        try:
+            self.deadline.__exit__(*exc_info)
+        finally:
+            self.session.__exit__(*exc_info)
+
+    def next(self):
+        '''
+        Returns the next result set.
+
+        :rtype: :class:`ResultSet`
+        '''
+        if self.cursor is None or not self.skip():
+            self.close()
+            raise StopIteration
+
+        self.current = ResultSet(self.backend, self.cursor)
+        return self.current
+
+    def skip(self):
+        '''
+        Discard the rows of the current result set and move to the next set
+        with rows.
+
+        :rtype: bool, ``False`` if there are no more result sets
+        '''
+        if self.current is None:
+            # The cursor is positioned on the first result
+            self.current = False
+        else:
+            if self.current:
+                self.current.drain()
+            if not self.backend.next_result(self.cursor):
+                return False
+
+        while not self.backend.has_rows(self.cursor):
+            if not self.backend.next_result(self.cursor):
+                return False
+        return True
+
+
+class ResultSet(object):
+    '''
+    Rows of one result of a procedure call, fetched on demand in chunks of
+    ``itersize`` rows as configured on the backend.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param cursor: DB API 2.0 cursor positioned on the result
+    '''
+
+    def __init__(self, backend, cursor):
+        self.backend = backend
+        self.cursor = cursor
+        self.done = False
+
+    def __iter__(self):
+        factory = None
+        while not self.done:
+            rows = self.fetch()
+            if factory is None and rows:
+                factory = self.backend.get_rows(self.cursor.description)
+            for row in rows:
+                yield factory.row(row)
+
+    def all(self):
+        '''
+        Returns the unread rows, built by the row factory of the backend
+        as a whole, for example as columns.
+        '''
+        rows = []
+        while not self.done:
+            rows.extend(self.fetch())
+        if not rows:
+            return []
+        return self.backend.get_rows(self.cursor.description).rows(rows)
+
+    def drain(self):
+        '''
+        Discard the unread rows, without loading them into memory at once.
+        '''
+        while not self.done:
+            self.fetch()
+
+    def fetch(self):
+        if self.done:
+            return []
+
+        rows = self.cursor.fetchmany(self.backend.itersize)
+        if not rows:
+            self.done = True
+        return rows
@@ -0,0 +1,172 @@
+'''
+Routing of procedure calls to read replicas.
+
+Pass a list of replica connections, or :class:`dbproc.pool.Pool` objects,
+to :class:`dbproc.wrap.Wrap` as `replicas`, or a :class:`Replicas` object to
+configure the routing. Calls to read only procedures are sent to a replica,
+all other calls go to the primary connection of the wrapper. Procedures are
+read only if they are declared ``IMMUTABLE`` or ``STABLE`` on PostgreSQL,
+or ``NO SQL`` or ``READS SQL DATA`` on MySQL.
+
+Calls are never routed to replicas within a session, or on a connection
+bound with :meth:`dbproc.backend.base.Backend.bind`, so a session reads
+its own writes. Outside of sessions, `read_your_writes` sends the reads of
+a thread to the primary for a number of seconds after it called a
+procedure on the primary, to hide the replication delay. Calls made in
+sessions, with ``many``, ``stream`` or in batches count as well.
+
+Only single calls are routed, batched calls made with ``many``, streamed
+calls and calls returning several result sets use the primary.
+
+>>> replicas = Replicas([replica1, replica2], routes={'next_id': 'primary'})
+>>> wrapped = Wrap(primary, replicas=replicas)
+>>> wrapped.get_user(42)    # STABLE, runs on a replica
+'''
+
+import contextlib
+import itertools
+import random
+import threading
+import time
+
+from dbproc.pool import Pool
+
+ROUTES = ('primary', 'replica')
+
+
+class Replicas(object):
+    '''
+    Routes calls to read only procedures to one of the `connections`. The
+    routing can be overridden per procedure in `routes`, which maps the
+    procedure name to ``primary`` or ``replica``.
+
+    Calls are spread over the replicas by the `balance` strategy, which is
+    ``round_robin`` or ``random``. Plain replica connections are shared by
+    all threads, on backends that are ``threadsafe`` calls on a replica
+    connection are serialized by a lock per replica. Use pools to make
+    concurrent calls on a replica.
+
+    :param connections: list of DB API 2.0 connections, or
+                        :class:`dbproc.pool.Pool` objects
+    :param routes: dict of procedure name to ``primary`` or ``replica``
+    :param read_your_writes: seconds after a call on the primary during
+                             which the reads of the thread use the primary
+    :param balance: ``round_robin`` or ``random``
+    '''
+
+    def __init__(self, connections, routes=None, read_your_writes=0,
+            balance='round_robin'):
+        self.connections = list(connections)
+        if not self.connections:
+            raise ValueError('At least one replica is required')
+        self.routes = dict(routes or {})
+        for name, route in self.routes.iteritems():
+            if route not in ROUTES:
+                raise ValueError('Unknown route %r for %s' % (route, name))
+        if balance not in ('round_robin', 'random'):
+            raise ValueError('Unknown balance strategy %r' % (balance,))
+
+        self.read_your_writes = read_your_writes
+        self.balance = balance
+        self.counter = itertools.count()
+        self.locks = [threading.RLock() for connection in self.connections]
+        self.local = threading.local()
+        self.calls = [0] * len(self.connections)
+
+    def accepts(self, procedure):
+        '''
+        Check if the call to `procedure` should be sent to a replica. Calls
+        that go to the primary are remembered for `read_your_writes`.
+
+        :param procedure: instance of :class:`dbproc.procedure.Procedure`
+        :rtype: bool
+        '''
+        local = procedure.backend.local
+        if getattr(local, 'connection', None) or \
+                getattr(local, 'sessions', 0):
+            return False
+
+        if self.route(procedure) == 'primary':
+            self.record(procedure)
+            return False
+        elif self.read_your_writes:
+            written = getattr(self.local, 'written', None)
+            if written is not None and \
+                    time.time() - written < self.read_your_writes:
+                return False
+        return True
+
+    def record(self, procedure):
+        '''
+        Remember that the current thread called `procedure`, for
+        `read_your_writes`. Only calls to procedures that are routed to the
+        primary are writes.
+
+        :param procedure: instance of :class:`dbproc.procedure.Procedure`
+        '''
+        if self.read_your_writes and self.route(procedure) == 'primary':
+            self.local.written = time.time()
+
+    def route(self, procedure):
+        '''
+        Returns ``primary`` or ``replica``, the route of calls to
+        `procedure` outside of sessions.
+
+        :param procedure: instance of :class:`dbproc.procedure.Procedure`
+        :rtype: str
+        '''
+        route = self.routes.get(procedure.proc)
+        if route is None:
+            route = procedure.read_only and 'replica' or 'primary'
+        return route
+
+    @contextlib.contextmanager
+    def checkout(self, backend):
+        '''
+        Bind a connection to the next replica to `backend`, for the calls
+        made by the current thread within the context.
+
+        >>> with replicas.checkout(backend) as connection:
+        ...     backend['test'](...)
+        '''
+        index = self.select()
+        self.calls[index] += 1
+        connection = self.connections[index]
+        if isinstance(connection, Pool):
+            with connection.connection() as connection:
+                with backend.bind(connection):
+                    yield connection
+        elif backend.lock is None:
+            with backend.bind(connection):
+                yield connection
+        else:
+            with backend.bind(connection):
+                with self.locks[index]:
+                    yield connection
+
+    def run(self, procedure, query_args):
+        '''
+        Call `procedure` with bound `query_args` on a replica.
+        '''
+        with self.checkout(procedure.backend):
+            return procedure.run(query_args)
+
+    def select(self):
+        '''
+        Returns the index of the replica for the next call.
+
+        :rtype: int
+        '''
+        if self.balance == 'random':
+            return random.randrange(len(self.connections))
+        else:
+            return next(self.counter) % len(self.connections)
+
+    def stats(self):
+        '''
+        Returns the number of calls routed to each replica, in the order of
+        :attr:`connections`.
+
+        :rtype: list of int
+        '''
+        return list(self.calls)
@@ -0,0 +1,127 @@
+'''
+Row factories turn the rows fetched from a cursor into result objects.
+
+The following factories are available by name:
+
+============ ===============================================================
+``dict``     a :class:`dict` per row, mapping column names to values
+``tuple``    a :class:`tuple` per row, as returned by the cursor
+``record``   a :func:`collections.namedtuple` per row, the record class is
+             created once per result shape
+``columns``  a :class:`dict` mapping column names to lists of values
+``arrays``   like ``columns``, but integer and float columns are returned as
+             :class:`array.array`
+============ ===============================================================
+'''
+
+import array
+import collections
+import functools
+from itertools import izip
+from operator import itemgetter
+
+
+class RowFactory(object):
+    '''
+    Base class for row factories. A factory is created once for each result
+    shape, as identified by the column `names`.
+
+    :param names: tuple of column names
+    '''
+
+    def __init__(self, names):
+        self.names = names
+
+    def row(self, row):
+        '''
+        Returns the result object for a single `row`.
+
+        :param row: tuple of values
+        '''
+        raise NotImplementedError
+
+    def rows(self, rows):
+        '''
+        Returns the result object for a list of `rows`.
+
+        :param rows: list of tuples of values
+        '''
+        return map(self.row, rows)
+
+
+class DictRows(RowFactory):
+    def row(self, row):
+        return dict(izip(self.names, row))
+
+
+class TupleRows(RowFactory):
+    def row(self, row):
+        return row
+
+    def rows(self, rows):
+        return list(rows)
+
+
+class RecordRows(RowFactory):
+    def __init__(self, names):
+        super(RecordRows, self).__init__(names)
+        self.record = collections.namedtuple('Record', names, rename=True)
+        # Skips the length check of Record._make, rows always match
+        self.row = functools.partial(tuple.__new__, self.record)
+
+
+class ColumnRows(RowFactory):
+    def row(self, row):
+        return dict(izip(self.names, row))
+
+    def rows(self, rows):
+        return dict([
+            (name, map(itemgetter(index), rows))
+            for index, name in enumerate(self.names)
+        ])
+
+
+class ArrayRows(ColumnRows):
+    typecodes = {
+        int: 'l',
+        long: 'l',
+        float: 'd',
+    }
+
+    def rows(self, rows):
+        result = super(ArrayRows, self).rows(rows)
+        for name, column in result.iteritems():
+            typecode = column and self.typecodes.get(type(column[0]))
+            if typecode is None:
+                continue
+            try:
+                result[name] = array.array(typecode, column)
+            except (TypeError, OverflowError):
+                # Mixed types or None values, keep the list
+                pass
+        return result
+
+
+FACTORIES = {
+    'arrays': ArrayRows,
+    'columns': ColumnRows,
+    'dict': DictRows,
+    'record': RecordRows,
+    'tuple': TupleRows,
+}
+
+
+def get_factory(factory):
+    '''
+    Returns the row factory class for `factory`, which is either the name of
+    a factory, or a :class:`RowFactory` subclass.
+
+    :rtype: :class:`RowFactory` subclass
+    '''
+    if isinstance(factory, basestring):
+        try:
+            return FACTORIES[factory]
+        except KeyError:
+            raise ValueError('Unknown row factory %r' % (factory,))
+    else:
+        return factory
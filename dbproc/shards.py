@@ -0,0 +1,283 @@
+'''
+Procedure calls across shards, databases that all carry the same stored
+procedures.
+
+A :class:`Shards` wrapper owns a :class:`dbproc.wrap.Wrap` per shard. The
+procedures are only inspected on the first shard, the other shards reuse
+its signatures. A call is either routed to one shard, selected by the `key`
+function from the call arguments, or fanned out to all shards at once on a
+thread pool, with the results merged:
+
+>>> sharded = Shards({'eu': eu, 'us': us},
+...                  key=lambda tenant, *args, **kwargs: tenant.region)
+>>> sharded.get_user(tenant, 42)            # routed by the key
+>>> sharded.count_users.all()               # list of counts, per shard
+>>> sharded.fanout('count_users', reduce=operator.add)
+>>> sharded.fanout('recent_orders', args=(10,),
+...                order_by=operator.itemgetter('created'))
+
+Requires the :mod:`concurrent.futures` module, available for Python 2 as
+the `futures <https://pypi.python.org/pypi/futures>`_ package. The futures
+returned by :meth:`Shards.submit` can be awaited in :mod:`asyncio` code
+using :func:`asyncio.wrap_future`.
+'''
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError
+except ImportError:
+    ThreadPoolExecutor = None
+
+import functools
+import heapq
+import time
+
+from dbproc.wrap import Wrap
+
+
+class ShardError(Exception):
+    '''
+    Raised when a fanned out call failed or timed out on some of the
+    shards. The `results` of the shards that succeeded, and the `errors` of
+    those that did not, are dicts keyed by shard name.
+    '''
+
+    def __init__(self, results, errors):
+        super(ShardError, self).__init__('Call failed on shard(s) %s' % (
+            ', '.join(map(str, sorted(errors))),
+        ))
+        self.results = results
+        self.errors = errors
+
+
+class Shards(object):
+    '''
+    Provide a stored procedure wrapper for a set of shards. `connections`
+    is a dict of shard name to connection, or to :class:`dbproc.pool.Pool`,
+    or a list, in which case the shards are named by their index.
+
+    Calls are routed by the `key` function, which is called with the
+    arguments of the call and returns the name of the shard. Fanned out
+    calls run on `workers` threads, by default one per shard, and fail with
+    a :class:`ShardError` on shards that did not respond within `timeout`
+    seconds. Calls that time out keep running on the shard, the shard
+    backends are thread safe so later calls wait for them.
+
+    :param connections: dict of shard name to connection or pool, or a list
+    :param key: callable that returns the shard name for call arguments
+    :param workers: number of worker threads
+    :param timeout: fan out timeout in seconds, ``None`` to wait forever
+    :param options: passed to :class:`dbproc.wrap.Wrap`
+    '''
+
+    def __init__(self, connections, key=None, workers=None, timeout=None,
+            **options):
+        if ThreadPoolExecutor is None:
+            raise ImportError('Shards requires the concurrent.futures '
+                              'module')
+
+        if isinstance(connections, dict):
+            self.names = sorted(connections)
+        else:
+            connections = dict(enumerate(connections))
+            self.names = range(len(connections))
+        if not self.names:
+            raise ValueError('At least one shard is required')
+
+        self.key = key
+        self.timeout = timeout
+        options.setdefault('threadsafe', True)
+
+        # Inspect the first shard only, the other shards are assumed to have
+        # the same procedures, in their own default schema if none is given
+        first = self.names[0]
+        self.shards = {first: Wrap(connections[first], **options)}
+        with self.shards[first].session():
+            signatures = self.shards[first].backend.signatures()
+        schemas = self.shards[first].backend.schemas
+        options.update(cache=None, eager=False, snapshot=None)
+        for name in self.names:
+            wrapped = self.shards.get(name)
+            if wrapped is None:
+                wrapped = self.shards[name] = Wrap(connections[name],
+                                                   **options)
+            rename = dict(zip(schemas, wrapped.backend.schemas))
+            wrapped.backend.load([
+                dict(signature, schema=rename.get(signature['schema'],
+                                                  signature['schema']))
+                for signature in signatures
+            ])
+            wrapped.backend.eager = True
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or len(self.names),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        # Fail early for unknown procedures
+        getattr(self.shards[self.names[0]], attr)
+        return ShardedProcedure(self, attr)
+
+    def call(self, name, args=(), kwargs=None):
+        '''
+        Call the procedure `name` on the shard selected by the `key`
+        function.
+        '''
+        kwargs = kwargs or {}
+        if self.key is None:
+            raise TypeError('Shards without a key function can only fan out')
+        return getattr(self.shard(self.key(*args, **kwargs)), name)(*args,
+                                                                    **kwargs)
+
+    def close(self):
+        '''
+        Wait for pending calls to finish, and stop the worker threads.
+        '''
+        self.executor.shutdown(wait=True)
+
+    def fanout(self, name, args=(), kwargs=None, order_by=None, reduce=None,
+            merge=None, timeout=None):
+        '''
+        Call the procedure `name` on all shards at once, and merge the
+        results. By default, the results are concatenated in shard order,
+        results that are not lists are collected in a list. Alternatively:
+
+        * `order_by`, merge results that are sorted by the `order_by` key
+          function into one sorted list;
+        * `reduce`, combine the results with a function of two arguments;
+        * `merge`, call a function with the dict of results by shard name.
+
+        :param name: procedure name
+        :param args: positional arguments
+        :param kwargs: keyword arguments
+        :param order_by: key function of the sorted results
+        :param reduce: function of two results
+        :param merge: function of the dict of results
+        :param timeout: seconds, defaults to the timeout of the shards
+        :raises: :class:`ShardError` if any shard failed
+        '''
+        results = self.gather(self.submit(name, args, kwargs), timeout)
+        ordered = [results[shard] for shard in self.names]
+        if merge is not None:
+            return merge(results)
+        elif reduce is not None:
+            return functools.reduce(reduce, ordered)
+        elif order_by is not None:
+            return sorted_merge(ordered, order_by)
+        else:
+            return concat(ordered)
+
+    def gather(self, futures, timeout=None):
+        '''
+        Wait for the `futures` of a fanned out call, by shard name.
+
+        :rtype: dict of shard name to result
+        :raises: :class:`ShardError` if any shard failed or timed out
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        deadline = timeout is not None and time.time() + timeout
+        results = {}
+        errors = {}
+        for shard, future in futures.iteritems():
+            remaining = deadline and max(deadline - time.time(), 0)
+            try:
+                results[shard] = future.result(
+                    remaining if deadline else None,
+                )
+            except TimeoutError, e:
+                future.cancel()
+                errors[shard] = e
+            except Exception, e:
+                errors[shard] = e
+
+        if errors:
+            raise ShardError(results, errors)
+        return results
+
+    def shard(self, name):
+        '''
+        Returns the wrapper of the shard `name`.
+
+        :rtype: :class:`dbproc.wrap.Wrap`
+        '''
+        try:
+            return self.shards[name]
+        except KeyError:
+            raise KeyError('No shard called %r' % (name,))
+
+    def submit(self, name, args=(), kwargs=None):
+        '''
+        Schedule a call of the procedure `name` on all shards.
+
+        :rtype: dict of shard name to :class:`concurrent.futures.Future`
+        '''
+        kwargs = kwargs or {}
+        return dict([
+            (shard, self.executor.submit(getattr(self.shards[shard], name),
+                                         *args, **kwargs))
+            for shard in self.names
+        ])
+
+
+class ShardedProcedure(object):
+    '''
+    Callable wrapper for a stored procedure of :class:`Shards`. Calling it
+    routes the call by the key function, :meth:`all` fans it out.
+    '''
+
+    def __init__(self, shards, name):
+        self.shards = shards
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        return self.shards.call(self.name, args, kwargs)
+
+    def all(self, *args, **kwargs):
+        '''
+        Call the procedure on all shards and concatenate the results, see
+        :meth:`Shards.fanout`.
+
+        :rtype: list
+        '''
+        return self.shards.fanout(self.name, args, kwargs)
+
+
+def concat(results):
+    '''
+    Concatenate a list of `results`, results that are not lists are
+    collected as one item.
+
+    :rtype: list
+    '''
+    merged = []
+    for result in results:
+        if isinstance(result, list):
+            merged.extend(result)
+        else:
+            merged.append(result)
+    return merged
+
+
+def sorted_merge(results, key):
+    '''
+    Merge a list of lists of rows that are sorted by the `key` function
+    into one sorted list.
+
+    :rtype: list
+    '''
+    # Decorated with the index of the list and row, so rows with equal keys
+    # are never compared
+    decorated = [
+        [(key(row), index, position, row)
+         for position, row in enumerate(rows)]
+        for index, rows in enumerate(results)
+    ]
+    return [item[3] for item in heapq.merge(*decorated)]
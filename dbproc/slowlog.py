@@ -0,0 +1,158 @@
+'''
+Log of slow procedure calls.
+
+A :class:`SlowLog` passed to :class:`dbproc.wrap.Wrap` logs every procedure
+call that takes longer than a threshold, with the procedure name, the bound
+arguments and the call duration, to the ``dbproc.slowlog`` logger. The most
+recent slow calls are kept in a ring buffer.
+
+Optionally, the query plan of a sample of the slow calls is captured on a
+separate cursor, using ``EXPLAIN (ANALYZE, FORMAT JSON)`` on PostgreSQL, or
+``EXPLAIN`` for MySQL stored functions. As ``ANALYZE`` runs the call again,
+it is only used for functions declared ``IMMUTABLE`` or ``STABLE``, the
+plans of volatile functions are estimated. MySQL stored procedures can not
+be explained.
+
+>>> slowlog = SlowLog(threshold=0.5, explain=0.1, redact=['password'])
+>>> wrapped = Wrap(connection, slowlog=slowlog)
+>>> wrapped.login('admin', 'secret')
+>>> slowlog.entries()
+[{'routine': 'public.login', 'args': ['admin', '***'], ...}]
+'''
+
+import collections
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger('dbproc.slowlog')
+
+
+class SlowLog(object):
+    '''
+    Logs procedure calls that take longer than `threshold` seconds, and
+    keeps the last `size` slow calls.
+
+    Arguments are passed through `redact` before they are logged, this is
+    either a callable that is called with the procedure and the list of
+    bound arguments and returns the arguments to log, or a collection of
+    parameter names whose values are replaced by ``***``. All arguments are
+    replaced if the parameter names of the procedure are unknown.
+
+    To bound the overhead when many calls are slow, only a `sample` fraction
+    of the slow calls is logged, and the query plan is captured for an
+    `explain` fraction of the logged calls.
+
+    :param threshold: call duration in seconds
+    :param redact: callable, or collection of parameter names
+    :param sample: fraction of the slow calls that is logged
+    :param explain: fraction of the logged calls to capture the plan of
+    :param size: number of slow calls to keep
+    '''
+
+    def __init__(self, threshold=1.0, redact=None, sample=1.0, explain=0.0,
+            size=100):
+        self.threshold = threshold
+        self.redact = redact
+        self.sample = sample
+        self.explain = explain
+        self.recent = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def capture(self, procedure, query_args):
+        '''
+        Returns the query plan of the call of `procedure` with `query_args`,
+        or the error that prevented capturing it.
+        '''
+        cursor = None
+        try:
+            cursor = procedure.backend.get_cursor(plain=True)
+            return procedure.explain(cursor, query_args)
+        except Exception, e:
+            return 'EXPLAIN failed: %s' % (e,)
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def entries(self):
+        '''
+        Returns the recent slow calls, oldest first. Each call is a dict with
+        the ``routine`` name, the redacted ``args``, the ``duration`` in
+        seconds, the ``time`` the call started, the ``error`` if the call
+        failed and the query ``plan`` if it was captured.
+
+        :rtype: list of dict
+        '''
+        with self.lock:
+            return list(self.recent)
+
+    def measure(self, procedure, query_args):
+        '''
+        Call `procedure` with bound `query_args`, in a session of the backend,
+        and log the call if it is slow.
+        '''
+        with procedure.backend.session():
+            start = time.time()
+            try:
+                result = procedure.call(query_args)
+            except Exception, e:
+                self.observe(procedure, query_args, start, e)
+                raise
+
+            self.observe(procedure, query_args, start)
+            return result
+
+    def observe(self, procedure, query_args, start, error=None):
+        '''
+        Log the call of `procedure` with `query_args` that started at
+        `start`, if it was slow.
+        '''
+        duration = time.time() - start
+        if duration < self.threshold or \
+                (self.sample < 1 and random.random() >= self.sample):
+            return
+
+        entry = dict(
+            routine='%s.%s' % (procedure.schema, procedure.proc),
+            args=self.redacted(procedure, query_args),
+            duration=duration,
+            time=start,
+            error=error and repr(error),
+            plan=None,
+        )
+        if self.explain and random.random() < self.explain:
+            entry['plan'] = self.capture(procedure, query_args)
+
+        with self.lock:
+            self.recent.append(entry)
+        logger.warning('Slow call to %s(%s) took %.3f s%s', entry['routine'],
+                       ', '.join(map(repr, entry['args'])), duration,
+                       error and ' and failed: %r' % (error,) or '')
+
+    def redacted(self, procedure, query_args):
+        '''
+        Returns the arguments to log for a call of `procedure` with bound
+        `query_args`.
+
+        :rtype: list
+        '''
+        if self.redact is None:
+            return list(query_args)
+        elif callable(self.redact):
+            return list(self.redact(procedure, query_args))
+
+        param_index = procedure.param_index
+        if param_index is None and getattr(procedure, 'param_name', None):
+            param_index = dict((name, index) for index, name
+                               in enumerate(procedure.param_name))
+        if param_index is None:
+            # Parameter names unknown, mask all arguments
+            return ['***'] * len(query_args)
+
+        args = list(query_args)
+        for name in self.redact:
+            index = param_index.get(name)
+            if index is not None and index < len(args):
+                args[index] = '***'
+        return args
@@ -0,0 +1,158 @@
+'''
+Persistent snapshots of stored procedure signatures.
+
+A snapshot holds the signatures of all procedures in the schemas of a
+backend, together with a fingerprint of their catalog. Loading a snapshot
+makes an inventory of the schemas without inspecting the catalog; only the
+fingerprint is queried to detect stale snapshots, which are refreshed.
+
+Snapshots can be created at deploy time from the command line::
+
+    python -m dbproc.snapshot pgsql 'dbname=test' test.json --schema public
+'''
+
+import json
+import os
+import warnings
+
+VERSION = 5
+
+
+def dump(backend, filename, fingerprint=None):
+    '''
+    Inspect the catalog of `backend` and write a snapshot of all procedure
+    signatures to `filename`.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param filename: path of the snapshot file
+    :param fingerprint: catalog fingerprint, if it was already queried
+    :rtype: dict
+    '''
+    snapshot = dict(
+        version=VERSION,
+        backend=backend.__class__.__name__,
+        schemas=backend.schemas,
+        prefix=backend.prefix,
+        fingerprint=fingerprint or backend.fingerprint(),
+        signatures=backend.signatures(),
+    )
+
+    # Write to a temporary file first, other processes may be loading the
+    # snapshot at the same time.
+    temp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(temp, 'w') as handle:
+        json.dump(snapshot, handle, indent=1, sort_keys=True)
+    os.rename(temp, filename)
+    return snapshot
+
+
+def read(filename):
+    '''
+    Read a snapshot from `filename`.
+
+    :param filename: path of the snapshot file
+    :rtype: dict, or ``None`` if there is no (compatible) snapshot
+    '''
+    try:
+        with open(filename) as handle:
+            snapshot = json.load(handle)
+    except (IOError, ValueError):
+        return None
+
+    if snapshot.get('version') != VERSION:
+        return None
+    else:
+        return snapshot
+
+
+def load(backend, filename, verify=True):
+    '''
+    Load the procedure signatures for `backend` from the snapshot in
+    `filename`. If the snapshot is missing, does not match the backend, or
+    its fingerprint does not match the catalog, the catalog is inspected and
+    the snapshot is rewritten.
+
+    :param backend: instance of :class:`dbproc.backend.base.Backend`
+    :param filename: path of the snapshot file
+    :param verify: compare the snapshot fingerprint with the catalog
+    :rtype: bool, ``True`` if the snapshot was up to date
+    '''
+    snapshot = read(filename)
+    fingerprint = None
+    fresh = snapshot is not None and \
+        snapshot['backend'] == backend.__class__.__name__ and \
+        snapshot['schemas'] == backend.schemas and \
+        snapshot['prefix'] == backend.prefix
+    if fresh and verify:
+        fingerprint = backend.fingerprint()
+        fresh = snapshot['fingerprint'] == fingerprint
+
+    if not fresh:
+        try:
+            snapshot = dump(backend, filename, fingerprint)
+        except (IOError, OSError), e:
+            warnings.warn('Unable to write snapshot %s: %s' % (filename, e))
+            snapshot = dict(signatures=backend.signatures())
+
+    backend.load(snapshot['signatures'])
+    if backend.cache is not None:
+        backend.cache.set(backend.cache_key(), snapshot['signatures'])
+
+    # The snapshot is a full inventory, procedures that are not in it do
+    # not have to be looked up in the catalog.
+    backend.eager = True
+    return fresh
+
+
+def connect(driver, dsn):
+    '''
+    Open a connection for `driver` using `dsn`. For ``pgsql`` the `dsn` is
+    passed to :func:`psycopg2.connect`, for ``mysql`` it is parsed as
+    ``key=value`` pairs and passed to :func:`MySQLdb.connect`.
+
+    :param driver: ``pgsql`` or ``mysql``
+    :param dsn: connection string
+    '''
+    if driver == 'pgsql':
+        import psycopg2
+        return psycopg2.connect(dsn)
+    elif driver == 'mysql':
+        import MySQLdb
+        kwargs = dict(pair.split('=', 1) for pair in dsn.split())
+        if 'port' in kwargs:
+            kwargs['port'] = int(kwargs['port'])
+        return MySQLdb.connect(**kwargs)
+    else:
+        raise ValueError('Unsupported driver %r' % driver)
+
+
+def main(args=None):
+    import argparse
+    from dbproc.wrap import Wrap
+
+    parser = argparse.ArgumentParser(
+        description='Write a snapshot of stored procedure signatures',
+    )
+    parser.add_argument('driver', choices=['mysql', 'pgsql'])
+    parser.add_argument('dsn', help='connection string')
+    parser.add_argument('filename', help='path of the snapshot file')
+    parser.add_argument('--schema', action='append', default=None,
+                        help='name of the schema, may be repeated')
+    options = parser.parse_args(args)
+
+    connection = connect(options.driver, options.dsn)
+    try:
+        wrapped = Wrap(connection, schema=options.schema, cache=None)
+        snapshot = dump(wrapped.backend, options.filename)
+    finally:
+        connection.close()
+
+    print 'Wrote %d signatures for schemas %s to %s' % (
+        len(snapshot['signatures']),
+        ', '.join(snapshot['schemas']),
+        options.filename,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,129 @@
-from dbproc.backend import mysql, pgsql
+import dbproc.snapshot
+from dbproc.batch import Batch
 from dbproc.backend.base import Backend
+from dbproc.cache import metadata
+from dbproc.pool import Pool
+from dbproc.replicas import Replicas
 
 
 class Wrap(object):
     '''
     Provide a stored procedure wrapper for the given `connection`, optionally
-    you may provide an alternate `schema`. You can also limit the callable
-    procedures by supplying a `prefix`.
+    you may provide an alternate `schema`, or a list of schemas to search in
+    order. By default the PostgreSQL ``search_path`` is used, or the current
+    database on MySQL. You can also limit the callable procedures by
+    supplying a `prefix`, only procedures matching it are inspected.
 
-    :param connection: instance of DB API 2.0 connection
-    :param schema: name of the schema
+    Procedures are looked up in the database catalog the first time they are
+    accessed. Pass ``eager=True`` to make an inventory of all procedures in
+    the schema up front instead. Signatures are shared with other wrappers
+    for the same server and schema through the metadata `cache`, pass
+    ``cache=None`` to always query the catalog. If a `snapshot` file is
+    given, signatures are loaded from it instead, see :mod:`dbproc.snapshot`.
+
+    With ``prepare=True``, procedures are called through server side prepared
+    statements. On MySQL this only applies to stored functions, and
+    arguments are passed as user variables, set in the same query that
+    executes the statement.
+
+    Each procedure also has a ``many`` method, to call it for a sequence of
+    arguments in batches of `chunk_size` calls per round-trip, for example
+    ``wrapped.test.many([(1, 2), (3, 4)])``. Results of set returning
+    procedures can be streamed with ``stream``, which fetches `itersize`
+    rows at a time from a server side cursor.
+
+    Large results can be fetched into a NumPy array per column with
+    ``columns``, or as Arrow record batches with ``batches``, see
+    :mod:`dbproc.columnar`.
+
+    Procedures that return several result sets can be called through
+    ``results``, or ``stream_results`` to read rows from the server as they
+    are fetched, which return a lazy sequence of result sets, see
+    :class:`dbproc.procedure.ResultSets`.
+
+    Calls to overloaded PostgreSQL functions are dispatched to the overload
+    that accepts the number and names of the given arguments, see
+    :class:`dbproc.backend.pgsql.PgSQLOverloads`. Arguments for parameters
+    with a default value may be omitted.
+
+    Result rows are returned as dicts by default, use `row_factory` to select
+    another representation, see :mod:`dbproc.rows`. Procedures returning a
+    single value return the value itself.
+
+    Pass a :class:`dbproc.cache.ResultCache` as `memo` to serve repeated
+    calls to procedures declared ``IMMUTABLE`` (PostgreSQL) or
+    ``DETERMINISTIC`` (MySQL) from memory, for example
+    ``Wrap(connection, memo=ResultCache(ttl=600))``.
+
+    Pass a :class:`dbproc.metrics.Metrics` registry as `metrics` to record
+    call counts and latencies per procedure, and a
+    :class:`dbproc.slowlog.SlowLog` as `slowlog` to log slow calls.
+
+    Pass a list of replica connections or pools as `replicas`, to route
+    calls to read only procedures to the replicas, or a
+    :class:`dbproc.replicas.Replicas` object to configure the routing.
+    Slow calls to read only procedures can be hedged on another connection
+    of the pool or another replica, by passing a
+    :class:`dbproc.hedging.Hedging` policy as `hedging`.
+
+    Calls that do not finish within `timeout` seconds are cancelled, and
+    raise :class:`dbproc.backend.base.CallTimeout`. Use :meth:`deadline` to
+    change the timeout for some calls, or ``with_timeout`` on a procedure,
+    for example ``wrapped.test.with_timeout(0.5)(...)``.
+
+    Each thread reuses its cursor across calls on the same connection, pass
+    ``reuse_cursors=False`` to create a new cursor per call. To share one
+    wrapper and its connection between threads, for example in a thread
+    pool executor, pass ``threadsafe=True``. Calls then hold a lock on the
+    connection, see :meth:`dbproc.backend.base.Backend.session`.
+
+    Instead of a connection, a :class:`dbproc.pool.Pool` can be passed. Each
+    call then checks out a connection from the pool, and commits it when
+    the call succeeds. Use :meth:`session` to make several calls on one
+    connection, in one transaction.
+
+    :param connection: instance of DB API 2.0 connection, or a
+                       :class:`dbproc.pool.Pool`
+    :param schema: name of the schema, or list of names
     :param prefix: name prefix
+    :param snapshot: path of a snapshot file
+    :param replicas: list of replica connections or pools, or a
+                     :class:`dbproc.replicas.Replicas`
+    :param options: backend options, see
+                    :class:`dbproc.backend.base.Backend`
     :rtype: instance of :class:`dbproc.backend.base.Backend`
 
     >>> wrapped = Wrap(connection)
     >>> wrapped.test(...)
     ...
     '''
-    def __init__(self, connection, schema=None, prefix=''):
-        self.backend = Backend.for_connection(connection,
-                                              schema=schema)
+    def __init__(self, connection, schema=None, prefix='', snapshot=None,
+            replicas=None, **options):
+        options.setdefault('cache', metadata)
+        if replicas is not None and not isinstance(replicas, Replicas):
+            replicas = Replicas(replicas)
+        options['replicas'] = replicas
+        if snapshot is not None:
+            options['eager'] = False
+
+        if isinstance(connection, Pool):
+            options['pool'] = connection
+            with options['pool'].connection() as connection:
+                self.backend = Backend.for_connection(connection,
+                                                      schema=schema,
+                                                      prefix=prefix,
+                                                      **options)
+                if snapshot is not None:
+                    dbproc.snapshot.load(self.backend, snapshot)
+                self.backend.connection = None
+        else:
+            self.backend = Backend.for_connection(connection,
+                                                  schema=schema,
+                                                  prefix=prefix,
+                                                  **options)
+            if snapshot is not None:
+                dbproc.snapshot.load(self.backend, snapshot)
+
         self.prefix = prefix
 
     def __getattr__(self, attr):
@@ -31,3 +135,34 @@ class Wrap(object):
                 return self.backend[proc]
             except KeyError:
                 raise AttributeError('No stored function/procedure called %s' % attr)
+
+    def batch(self):
+        '''
+        Queue the calls made on the batch, and execute them in one
+        transaction when the context exits, see :class:`dbproc.batch.Batch`.
+
+        >>> with wrapped.batch() as batch:
+        ...     result = batch.test(...)
+        >>> result.result()
+        '''
+        return Batch(self.backend, self.prefix)
+
+    def deadline(self, timeout):
+        '''
+        Use `timeout` for the calls within the context, see
+        :meth:`dbproc.backend.base.Backend.deadline`.
+
+        >>> with wrapped.deadline(0.5):
+        ...     wrapped.test(...)
+        '''
+        return self.backend.deadline(timeout)
+
+    def session(self):
+        '''
+        Make all calls within the context on one connection, see
+        :meth:`dbproc.backend.base.Backend.session`.
+
+        >>> with wrapped.session():
+        ...     wrapped.test(...)
+        '''
+        return self.backend.session()
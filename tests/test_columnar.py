@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc import columnar
+from dbproc.backend.mysql import MySQLBackend
+
+
+class Backend(object):
+    dtypes = MySQLBackend.dtypes
+    itersize = 2
+
+    def has_rows(self, cursor):
+        return cursor.description is not None
+
+    def next_result(self, cursor):
+        return False
+
+
+class Cursor(object):
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = list(rows)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+@unittest.skipIf(columnar.numpy is None, 'requires numpy')
+class MySQLColumnsTest(unittest.TestCase):
+    def columns(self, type_code, values):
+        cursor = Cursor([('value', type_code)], [(value,) for value in values])
+        return columnar.columns(Backend(), cursor)['value']
+
+    def test_unsigned_tinyint(self):
+        array = self.columns(1, [0, 127, 255])
+        self.assertEqual(array.tolist(), [0, 127, 255])
+
+    def test_unsigned_int(self):
+        array = self.columns(3, [1, 2 ** 31, 2 ** 32 - 1])
+        self.assertEqual(array.tolist(), [1, 2 ** 31, 2 ** 32 - 1])
+
+    def test_unsigned_bigint(self):
+        array = self.columns(8, [1, 2, 2 ** 64 - 1])
+        self.assertEqual(array.dtype, object)
+        self.assertEqual(array.tolist(), [1, 2, 2 ** 64 - 1])
+
+    def test_null(self):
+        array = self.columns(3, [1, None, 3])
+        self.assertEqual(array.dtype.kind, 'f')
+        self.assertEqual(array[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc.backend.mysql import MySQLBackend
+from dbproc.slowlog import SlowLog
+
+
+class Backend(object):
+    schema = 'test'
+
+
+class RedactTest(unittest.TestCase):
+    def create(self, signature):
+        return MySQLBackend.create.im_func(Backend(), signature)
+
+    def signature(self, routine_type, params):
+        return dict(proc='login', schema='test', routine_type=routine_type,
+                    data_type='int', volatility='volatile', params=params)
+
+    def test_function(self):
+        function = self.create(self.signature('FUNCTION', [
+            ['IN', 'username', 'varchar'],
+            ['IN', 'password', 'varchar'],
+        ]))
+        slowlog = SlowLog(redact=['password'])
+        self.assertEqual(slowlog.redacted(function, ['joe', 'secret']),
+                         ['joe', '***'])
+
+    def test_unknown_names(self):
+        function = self.create(self.signature('FUNCTION', []))
+        slowlog = SlowLog(redact=['password'])
+        self.assertEqual(slowlog.redacted(function, ['joe', 'secret']),
+                         ['***', '***'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dbproc.backend.base import Backend
+from dbproc.procedure import Procedure
+from dbproc.wrap import Wrap
+
+
+class Connection(object):
+    '''
+    Connection that records cursors, and calls that overlap on it.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cursors = []
+        self.running = 0
+        self.overlaps = 0
+
+    def cursor(self):
+        cursor = Cursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+
+class Cursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.closed = False
+        self.row = None
+
+    def close(self):
+        self.closed = True
+
+    def execute(self, query, params):
+        assert not self.closed, 'cursor is closed'
+        connection = self.connection
+        with connection.lock:
+            connection.running += 1
+            if connection.running > 1:
+                connection.overlaps += 1
+        try:
+            time.sleep(0.001)
+            if params[0] == 'boom':
+                raise ValueError('boom')
+            self.row = (params[0],)
+        finally:
+            with connection.lock:
+                connection.running -= 1
+
+    def fetchone(self):
+        return self.row
+
+
+class Echo(Procedure):
+    def __init__(self, backend, proc, schema):
+        self.backend = backend
+        self.proc = proc
+        self.schema = schema
+
+    def execute(self, cursor, query_args):
+        cursor.execute('SELECT %s' % self.proc, query_args)
+
+    def fetch(self, cursor):
+        return cursor.fetchone()[0]
+
+
+class EchoBackend(Backend):
+    @classmethod
+    def can_handle(self, instance):
+        return isinstance(instance, Connection)
+
+    def create(self, signature):
+        return Echo(self, signature['proc'], signature['schema'])
+
+    def get_cursor(self, plain=False):
+        return self.connection.cursor()
+
+    def signatures(self, func=None):
+        return [dict(proc='echo', schema='test')]
+
+
+class ThreadsafeTest(unittest.TestCase):
+    def test_concurrent_calls(self):
+        connection = Connection()
+        wrapped = Wrap(connection, schema='test', cache=None,
+                       threadsafe=True)
+        results = []
+
+        def work(offset):
+            for i in xrange(50):
+                results.append(wrapped.echo(offset + i))
+
+        threads = [threading.Thread(target=work, args=(n * 50,))
+                   for n in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), range(200))
+        self.assertEqual(connection.overlaps, 0)
+        # One cursor per thread, kept across its calls
+        self.assertEqual(len(connection.cursors), 4)
+
+    def test_error_discards_cursor(self):
+        connection = Connection()
+        wrapped = Wrap(connection, schema='test', cache=None,
+                       threadsafe=True)
+        self.assertEqual(wrapped.echo(1), 1)
+        self.assertEqual(wrapped.echo(2), 2)
+        self.assertEqual(len(connection.cursors), 1)
+
+        self.assertRaises(ValueError, wrapped.echo, 'boom')
+        self.assertTrue(connection.cursors[0].closed)
+        self.assertEqual(wrapped.echo(3), 3)
+        self.assertEqual(len(connection.cursors), 2)
+
+    def test_other_connection_closes_cursor(self):
+        first, second = Connection(), Connection()
+        wrapped = Wrap(first, schema='test', cache=None)
+        self.assertEqual(wrapped.echo(1), 1)
+        with wrapped.backend.bind(second):
+            self.assertEqual(wrapped.echo(2), 2)
+        self.assertTrue(first.cursors[0].closed)
+        self.assertFalse(second.cursors[0].closed)
+
+    def test_nested_call_closes_cursor(self):
+        connection = Connection()
+        wrapped = Wrap(connection, schema='test', cache=None)
+        backend = wrapped.backend
+        outer = backend.acquire_cursor()
+        inner = backend.acquire_cursor()
+        backend.release_cursor(inner)
+        backend.release_cursor(outer)
+        self.assertTrue(inner.closed)
+        self.assertFalse(outer.closed)
+        self.assertIs(backend.acquire_cursor(), outer)
+
+
+if __name__ == '__main__':
+    unittest.main()